@@ -1,52 +1,157 @@
 from flask import Blueprint, request, jsonify, render_template
 from werkzeug.security import generate_password_hash
 from config import get_db
+from upload_store import start_reconcile, last_reconcile_report
+from resume_archive import start_archive, last_archive_report
+import user_import
+import user_cleanup
+import dashboard
+import resume_stats
+import company_demand
+import roster_sync
+import os
+import tempfile
+from datetime import datetime
+import base64
+import json
+import time
 
 admin_bp = Blueprint("admin_bp", __name__, url_prefix="/admin")
 
 
+ROLE_DISPLAY = {
+    'ta': '科助',
+    'teacher': '老師',
+    'student': '學生',
+    'admin': '管理員',
+}
+
+# 可排序欄位：皆搭配 id 作為 keyset 分頁的第二鍵
+USER_SORT_COLUMNS = {
+    'created_at': 'u.created_at',
+    'username': 'u.username',
+    'id': 'u.id',
+}
+USER_PAGE_SIZE = 50
+USER_PAGE_SIZE_MAX = 200
+USER_COUNT_TTL = 60
+
+_user_count_cache = {}
+
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def _decode_cursor(token):
+    return json.loads(base64.urlsafe_b64decode(token.encode()))
+
+
+def _cached_user_count(where_clause, params):
+    """總筆數只作為分頁顯示用，快取一段時間避免每頁都 COUNT 全表"""
+    key = (where_clause, tuple(params))
+    cached = _user_count_cache.get(key)
+    if cached and cached[1] > time.time():
+        return cached[0]
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM users u {where_clause}", params)
+        total = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.close()
+    _user_count_cache[key] = (total, time.time() + USER_COUNT_TTL)
+    return total
+
+
+def _attach_teaching_classes(cursor, users):
+    """只針對本頁的老師 / 主任查詢帶班，一次 GROUP BY 取代逐列子查詢"""
+    teacher_ids = [u['id'] for u in users if u['role'] in ('teacher', 'director')]
+    teaching = {}
+    if teacher_ids:
+        format_strings = ','.join(['%s'] * len(teacher_ids))
+        cursor.execute(f"""
+            SELECT ct.teacher_id, GROUP_CONCAT(c.name SEPARATOR ', ') AS teaching_classes
+            FROM classes_teacher ct
+            JOIN classes c ON ct.class_id = c.id
+            WHERE ct.teacher_id IN ({format_strings})
+            GROUP BY ct.teacher_id
+        """, teacher_ids)
+        teaching = {row['teacher_id']: row['teaching_classes'] for row in cursor.fetchall()}
+    for user in users:
+        user['teaching_classes'] = teaching.get(user['id'])
+        user['role_display'] = ROLE_DISPLAY.get(user['role'], user['role'])
+
+
 @admin_bp.route('/api/get_all_users', methods=['GET'])
 def get_all_users():
+    role = request.args.get('role')
+    class_id = request.args.get('class_id', type=int)
+    sort = request.args.get('sort', 'created_at')
+    order = request.args.get('order', 'desc').lower()
+    limit = min(max(request.args.get('limit', USER_PAGE_SIZE, type=int), 1), USER_PAGE_SIZE_MAX)
+    page_cursor = request.args.get('cursor')
+
+    if sort not in USER_SORT_COLUMNS or order not in ('asc', 'desc'):
+        return jsonify({"success": False, "message": "排序參數錯誤"}), 400
+
+    conditions, params = ["u.deleted_at IS NULL"], []
+    if role:
+        conditions.append("u.role = %s")
+        params.append(role)
+    if class_id:
+        conditions.append("u.class_id = %s")
+        params.append(class_id)
+    filter_clause = "WHERE " + " AND ".join(conditions)
+
+    sort_column = USER_SORT_COLUMNS[sort]
+    op = '<' if order == 'desc' else '>'
+    page_conditions, page_params = list(conditions), list(params)
+    if page_cursor:
+        try:
+            last_value, last_id = _decode_cursor(page_cursor)
+        except Exception:
+            return jsonify({"success": False, "message": "分頁參數錯誤"}), 400
+        page_conditions.append(f"({sort_column} {op} %s OR ({sort_column} = %s AND u.id {op} %s))")
+        page_params += [last_value, last_value, last_id]
+    page_clause = "WHERE " + " AND ".join(page_conditions)
+
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
                 u.id, u.username, u.name, u.email, u.role, u.class_id,
                 c.name AS class_name,
                 c.department,
-                (
-                    SELECT GROUP_CONCAT(c2.name SEPARATOR ', ')
-                    FROM classes_teacher ct2
-                    JOIN classes c2 ON ct2.class_id = c2.id
-                    WHERE ct2.teacher_id = u.id
-                ) AS teaching_classes,
-                u.created_at
+                u.created_at,
+                {sort_column} AS sort_value
             FROM users u
             LEFT JOIN classes c ON u.class_id = c.id
-            -- 這裡不用特別限制 role，因為 ta 也是一個合法角色
-            -- 如果你只想撈出特定角色（例如 admin, teacher, student, ta），可以在這裡加 WHERE
-            ORDER BY u.created_at DESC
-        """)
+            {page_clause}
+            ORDER BY {sort_column} {order}, u.id {order}
+            LIMIT %s
+        """, page_params + [limit + 1])
         users = cursor.fetchall()
 
+        has_more = len(users) > limit
+        users = users[:limit]
+        next_cursor = _encode_cursor([users[-1]['sort_value'], users[-1]['id']]) if has_more else None
         for user in users:
-            if user.get('created_at'):
+            user.pop('sort_value')
+            if user['created_at']:
                 user['created_at'] = user['created_at'].strftime("%Y-%m-%d %H:%M:%S")
 
-            # 這裡可以針對新角色做額外處理（例如顯示名稱轉換）
-            if user.get('role') == 'ta':
-                user['role_display'] = '科助'
-            elif user.get('role') == 'teacher':
-                user['role_display'] = '老師'
-            elif user.get('role') == 'student':
-                user['role_display'] = '學生'
-            elif user.get('role') == 'admin':
-                user['role_display'] = '管理員'
-            else:
-                user['role_display'] = user['role']
+        _attach_teaching_classes(cursor, users)
 
-        return jsonify({"success": True, "users": users})
+        return jsonify({
+            "success": True,
+            "users": users,
+            "next_cursor": next_cursor,
+            "total": _cached_user_count(filter_clause, params),
+        })
     except Exception as e:
         print(f"獲取用戶列表錯誤: {e}")
         return jsonify({"success": False, "message": "獲取用戶列表失敗"}), 500
@@ -56,6 +161,17 @@ def get_all_users():
 
 
 
+# 需與 MySQL 的 ngram_token_size 設定一致；比這更短的關鍵字改用前綴比對
+NGRAM_TOKEN_SIZE = 2
+SEARCH_RESULT_LIMIT = 100
+SUGGEST_LIMIT = 10
+
+
+def _ngram_phrase(term):
+    # ngram 全文索引以片語模式比對即為子字串比對
+    return '"' + term.replace('"', ' ') + '"'
+
+
 @admin_bp.route('/api/search_users', methods=['GET'])
 def search_users():
     username = (request.args.get('username') or '').strip()
@@ -64,43 +180,56 @@ def search_users():
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
     try:
-        conditions = []
+        conditions = ["u.deleted_at IS NULL"]
         params = []
 
+        # 先以 ngram 全文索引縮小候選，再用 LIKE 精確過濾（只作用在候選列上）
         if username:
-            conditions.append("u.username LIKE %s")
-            params.append(f"%{username}%")
+            if len(username) >= NGRAM_TOKEN_SIZE:
+                conditions.append("MATCH(u.username, u.name, u.email) AGAINST (%s IN BOOLEAN MODE)")
+                params.append(_ngram_phrase(username))
+                conditions.append("u.username LIKE %s")
+                params.append(f"%{username}%")
+            else:
+                conditions.append("u.username LIKE %s")
+                params.append(f"{username}%")
 
         if filename:
-            conditions.append("EXISTS (SELECT 1 FROM resumes r WHERE r.user_id = u.id AND r.original_filename LIKE %s)")
-            params.append(f"%{filename}%")
+            if len(filename) >= NGRAM_TOKEN_SIZE:
+                conditions.append("""u.id IN (
+                    SELECT r.user_id FROM resumes r
+                    WHERE MATCH(r.original_filename) AGAINST (%s IN BOOLEAN MODE)
+                      AND r.original_filename LIKE %s AND r.deleted_at IS NULL
+                )""")
+                params += [_ngram_phrase(filename), f"%{filename}%"]
+            else:
+                conditions.append("""u.id IN (
+                    SELECT r.user_id FROM resumes r
+                    WHERE r.original_filename LIKE %s AND r.deleted_at IS NULL
+                )""")
+                params.append(f"{filename}%")
 
-        where_clause = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        where_clause = "WHERE " + " AND ".join(conditions)
 
         sql = f"""
             SELECT 
                 u.id, u.username, u.name, u.email, u.role, u.class_id,
                 c.name AS class_name,
                 c.department,
-                (
-                    SELECT GROUP_CONCAT(c2.name SEPARATOR ', ')
-                    FROM classes_teacher ct2
-                    JOIN classes c2 ON ct2.class_id = c2.id
-                    WHERE ct2.teacher_id = u.id
-                ) AS teaching_classes,
                 u.created_at
             FROM users u
             LEFT JOIN classes c ON u.class_id = c.id
             {where_clause}
             ORDER BY u.created_at DESC
+            LIMIT %s
         """
 
-        cursor.execute(sql, params)
+        cursor.execute(sql, params + [SEARCH_RESULT_LIMIT])
         users = cursor.fetchall()
-
         for user in users:
-            if user.get('created_at'):
+            if user['created_at']:
                 user['created_at'] = user['created_at'].strftime("%Y-%m-%d %H:%M:%S")
+        _attach_teaching_classes(cursor, users)
 
         return jsonify({"success": True, "users": users})
     except Exception as e:
@@ -110,6 +239,32 @@ def search_users():
         cursor.close()
         conn.close()
 
+@admin_bp.route('/api/user_suggest', methods=['GET'])
+def user_suggest():
+    prefix = (request.args.get('prefix') or '').strip()
+    if not prefix:
+        return jsonify({"success": True, "suggestions": []})
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # 帳號、姓名皆有 B-tree 索引，前綴比對可直接走索引
+        cursor.execute("""
+            (SELECT username AS value, name AS label FROM users
+             WHERE username LIKE %s AND deleted_at IS NULL ORDER BY username LIMIT %s)
+            UNION
+            (SELECT username AS value, name AS label FROM users
+             WHERE name LIKE %s AND deleted_at IS NULL ORDER BY name LIMIT %s)
+            LIMIT %s
+        """, (f"{prefix}%", SUGGEST_LIMIT, f"{prefix}%", SUGGEST_LIMIT, SUGGEST_LIMIT))
+        return jsonify({"success": True, "suggestions": cursor.fetchall()})
+    except Exception as e:
+        print(f"帳號建議錯誤: {e}")
+        return jsonify({"success": False, "message": "查詢失敗"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
 @admin_bp.route('/api/assign_student_class', methods=['POST'])
 def assign_student_class():
     data = request.get_json()
@@ -122,7 +277,7 @@ def assign_student_class():
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT role FROM users WHERE id=%s", (user_id,))
+        cursor.execute("SELECT role, class_id FROM users WHERE id=%s FOR UPDATE", (user_id,))
         user = cursor.fetchone()
         if not user or user[0] != 'student':
             return jsonify({"success": False, "message": "該用戶不是學生"}), 400
@@ -132,6 +287,10 @@ def assign_student_class():
             return jsonify({"success": False, "message": "班級不存在"}), 404
 
         cursor.execute("UPDATE users SET class_id=%s WHERE id=%s", (class_id, user_id))
+        resume_stats.on_class_change(cursor, user_id, user[1], int(class_id))
+        company_demand.on_class_change(cursor, user_id, user[1], int(class_id))
+        dashboard.bump(cursor, "students_by_class", user[1], -1)
+        dashboard.bump(cursor, "students_by_class", class_id, 1)
         conn.commit()
         return jsonify({"success": True, "message": "學生班級設定成功"})
     except Exception as e:
@@ -204,7 +363,8 @@ def admin_create_user():
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT id FROM users WHERE username = %s AND role = %s", (username, role))
+        cursor.execute("SELECT id FROM users WHERE username = %s AND role = %s AND deleted_at IS NULL",
+                       (username, role))
         if cursor.fetchone():
             return jsonify({"success": False, "message": "該帳號已存在此角色"}), 409
 
@@ -221,6 +381,7 @@ def admin_create_user():
                 VALUES (%s, %s, %s, %s, %s)
             """, (username, hashed_password, role, name, email))
 
+        dashboard.bump_user(cursor, role, class_id, 1)
         conn.commit()
         return jsonify({"success": True, "message": "用戶新增成功"})
     except Exception as e:
@@ -230,6 +391,48 @@ def admin_create_user():
         cursor.close()
         conn.close()
 
+@admin_bp.route('/api/import_users', methods=['POST'])
+def admin_import_users():
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({"success": False, "message": "未上傳檔案"}), 400
+    if not file.filename.lower().endswith(('.csv', '.xlsx')):
+        return jsonify({"success": False, "message": "僅支援 CSV / XLSX"}), 400
+
+    job_id = user_import.start_import(file)
+    return jsonify({"success": True, "job_id": job_id, "message": "匯入作業已開始"}), 202
+
+@admin_bp.route('/api/import_users/<job_id>', methods=['GET'])
+def admin_import_status(job_id):
+    job = user_import.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "查無此匯入作業"}), 404
+    return jsonify({"success": True, "job": job})
+
+@admin_bp.route('/api/roster_sync', methods=['POST'])
+def admin_roster_sync():
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({"success": False, "message": "未上傳檔案"}), 400
+    if not file.filename.lower().endswith(('.csv', '.xlsx')):
+        return jsonify({"success": False, "message": "僅支援 CSV / XLSX"}), 400
+
+    # 預設只試算差異，dry_run=0 才實際寫入
+    dry_run = request.form.get('dry_run', '1') != '0'
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(file.filename)[1].lower())
+    os.close(fd)
+    try:
+        file.save(path)
+        result = roster_sync.sync_roster(path, dry_run=dry_run)
+        if not dry_run and not result["applied"]:
+            return jsonify({"success": False, "message": "名單有錯誤，未套用變更", "result": result}), 400
+        return jsonify({"success": True, "result": result})
+    except Exception as e:
+        print(f"名單同步錯誤: {e}")
+        return jsonify({"success": False, "message": "名單同步失敗"}), 500
+    finally:
+        os.remove(path)
+
 @admin_bp.route('/api/update_user/<int:user_id>', methods=['PUT'])
 def admin_update_user(user_id):
     data = request.get_json()
@@ -250,8 +453,9 @@ def admin_update_user(user_id):
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
-        if not cursor.fetchone():
+        cursor.execute("SELECT role, class_id FROM users WHERE id = %s FOR UPDATE", (user_id,))
+        old = cursor.fetchone()
+        if not old:
             return jsonify({"success": False, "message": "用戶不存在"}), 404
 
         cursor.execute("SELECT id FROM users WHERE username = %s AND id != %s", (username, user_id))
@@ -283,6 +487,12 @@ def admin_update_user(user_id):
                     WHERE id=%s
                 """, (username, role, name, email, user_id))
 
+        if role == "student":
+            new_class = int(class_id) if class_id else None
+            resume_stats.on_class_change(cursor, user_id, old[1], new_class)
+            company_demand.on_class_change(cursor, user_id, old[1], new_class)
+        dashboard.bump_user(cursor, old[0], old[1], -1)
+        dashboard.bump_user(cursor, role, class_id if role == "student" else old[1], 1)
         conn.commit()
         return jsonify({"success": True, "message": "用戶更新成功"})
     except Exception as e:
@@ -297,16 +507,12 @@ def admin_delete_user(user_id):
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT id, role FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
-        if not user:
+        cursor.execute("SELECT id FROM users WHERE id = %s AND deleted_at IS NULL", (user_id,))
+        if not cursor.fetchone():
             return jsonify({"success": False, "message": "用戶不存在"}), 404
 
-        if user[1] in ('teacher', 'director'):
-            cursor.execute("DELETE FROM classes_teacher WHERE teacher_id = %s", (user_id,))
-
-        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-        conn.commit()
+        # 標記刪除後，履歷、志願、帶班與檔案由背景 worker 分批清除
+        user_cleanup.soft_delete_users([user_id])
         return jsonify({"success": True, "message": "用戶刪除成功"})
     except Exception as e:
         print(f"刪除用戶錯誤: {e}")
@@ -315,6 +521,70 @@ def admin_delete_user(user_id):
         cursor.close()
         conn.close()
 
+@admin_bp.route('/api/bulk_delete_users', methods=['POST'])
+def admin_bulk_delete_users():
+    data = request.get_json(silent=True) or {}
+    class_id = data.get('class_id')
+    graduation_year = data.get('graduation_year')
+    if not class_id and not graduation_year:
+        return jsonify({"success": False, "message": "需指定班級或畢業年度"}), 400
+
+    try:
+        marked = user_cleanup.delete_students(class_id=class_id, graduation_year=graduation_year)
+        return jsonify({"success": True, "marked": marked, "message": f"已排入刪除 {marked} 位學生"}), 202
+    except Exception as e:
+        print(f"批次刪除用戶錯誤: {e}")
+        return jsonify({"success": False, "message": "批次刪除失敗"}), 500
+
+@admin_bp.route('/api/bulk_delete_users', methods=['GET'])
+def admin_bulk_delete_status():
+    return jsonify({"success": True, "pending_batches": user_cleanup.pending_count()})
+
+@admin_bp.route('/api/dashboard_stats', methods=['GET'])
+def dashboard_stats():
+    conn = None
+    try:
+        stats = dashboard.get_counters()
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name FROM classes")
+        class_names = {str(class_id): name for class_id, name in cursor.fetchall()}
+        cursor.close()
+        return jsonify({"success": True, "stats": stats, "class_names": class_names})
+    except Exception as e:
+        print(f"取得統計錯誤: {e}")
+        return jsonify({"success": False, "message": "取得統計失敗"}), 500
+    finally:
+        if conn:
+            conn.close()
+
+@admin_bp.route('/api/reconcile_uploads', methods=['GET', 'POST'])
+def reconcile_uploads():
+    if request.method == 'GET':
+        return jsonify({"success": True, "report": last_reconcile_report()})
+
+    data = request.get_json(silent=True) or {}
+    if not start_reconcile(dry_run=data.get('dry_run', True)):
+        return jsonify({"success": False, "message": "對帳作業執行中"}), 409
+    return jsonify({"success": True, "message": "對帳作業已開始"})
+
+@admin_bp.route('/api/archive_resumes', methods=['GET', 'POST'])
+def archive_resumes():
+    if request.method == 'GET':
+        return jsonify({"success": True, "report": last_archive_report()})
+
+    data = request.get_json(silent=True) or {}
+    before = None
+    if data.get('before'):
+        try:
+            before = datetime.strptime(data['before'], "%Y-%m-%d")
+        except ValueError:
+            return jsonify({"success": False, "message": "日期格式錯誤（YYYY-MM-DD）"}), 400
+
+    if not start_archive(before):
+        return jsonify({"success": False, "message": "封存作業執行中"}), 409
+    return jsonify({"success": True, "message": "封存作業已開始"})
+
 @admin_bp.route('/api/teacher/classes/<int:user_id>', methods=['GET'])
 def get_classes_by_teacher(user_id):
     conn = get_db()
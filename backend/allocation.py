@@ -0,0 +1,380 @@
+from flask import Blueprint, request, jsonify, session
+from config import get_db
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import heapq
+import os
+import random
+import threading
+import traceback
+
+allocation_bp = Blueprint("allocation_bp", __name__)
+
+# 實習分發：學生提出的延遲接受演算法（deferred acceptance），結果為穩定配對。
+# 資料全部轉成以索引存取的 array（志願矩陣攤平成 n_students × MAX_PREFERENCES），
+# 演算法本身不碰資料庫；每位學生最多提出 MAX_PREFERENCES 次，總成本與志願總數成正比。
+# 公司對學生的排序：priority 分數高者優先，同分以抽籤號碼（lottery）小者優先。
+
+MAX_PREFERENCES = 5
+DEFAULT_CAPACITY = 1
+INSERT_BATCH_SIZE = 1000
+NO_COMPANY = -1
+MAX_SCENARIOS = 32
+
+_sim_pool = None
+_sim_pool_lock = threading.Lock()
+
+# -------------------------
+# 演算法
+# -------------------------
+def deferred_acceptance(prefs, capacities, priority, lottery, width=MAX_PREFERENCES):
+    """
+    prefs:      攤平的志願矩陣（公司索引，NO_COMPANY 為空），長度 n_students * width
+    capacities: 各公司名額
+    priority / lottery: 各學生的排序依據
+    回傳 (每位學生配到的公司索引, 配到的志願序 1..width；未配到皆為 NO_COMPANY / 0)
+    """
+    n_students = len(priority)
+    held = [[] for _ in range(len(capacities))]   # 每家公司暫時錄取者，heap 頂端為最差者
+    next_choice = array('b', bytes(n_students))
+    free = list(range(n_students - 1, -1, -1))
+
+    while free:
+        s = free.pop()
+        base = s * width
+        entry = (priority[s], -lottery[s], s)
+        while next_choice[s] < width:
+            c = prefs[base + next_choice[s]]
+            next_choice[s] += 1
+            if c == NO_COMPANY or capacities[c] <= 0:
+                continue
+            heap = held[c]
+            if len(heap) < capacities[c]:
+                heapq.heappush(heap, entry)
+                break
+            if entry > heap[0]:
+                # 取代目前最差的暫時錄取者，被擠掉的學生繼續往下一志願提出
+                free.append(heapq.heapreplace(heap, entry)[2])
+                break
+
+    assigned = array('i', [NO_COMPANY]) * n_students
+    rank = array('b', bytes(n_students))
+    for c, heap in enumerate(held):
+        for _, _, s in heap:
+            assigned[s] = c
+    for s in range(n_students):
+        c = assigned[s]
+        if c != NO_COMPANY:
+            base = s * width
+            for k in range(width):
+                if prefs[base + k] == c:
+                    rank[s] = k + 1
+                    break
+    return assigned, rank
+
+# -------------------------
+# 載入資料
+# -------------------------
+def load_problem(department=None):
+    """從資料庫讀出學生、公司與志願，轉成演算法使用的索引陣列"""
+    dept_filter = "AND c.department = %s" if department else ""
+    params = (department,) if department else ()
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT u.id FROM users u
+            JOIN classes c ON u.class_id = c.id
+            WHERE u.role = 'student' AND u.deleted_at IS NULL {dept_filter}
+            ORDER BY u.id
+        """, params)
+        student_ids = array('i', (row[0] for row in cursor.fetchall()))
+
+        cursor.execute("""
+            SELECT id, COALESCE(capacity, %s) FROM internship_companies
+            WHERE status = 'approved'
+            ORDER BY id
+        """, (DEFAULT_CAPACITY,))
+        company_ids, capacities = array('i'), array('i')
+        for company_id, capacity in cursor.fetchall():
+            company_ids.append(company_id)
+            capacities.append(capacity)
+
+        student_index = {sid: i for i, sid in enumerate(student_ids)}
+        company_index = {cid: i for i, cid in enumerate(company_ids)}
+        prefs = array('i', [NO_COMPANY]) * (len(student_ids) * MAX_PREFERENCES)
+
+        cursor.execute(f"""
+            SELECT sp.student_id, sp.preference_order, sp.company_id
+            FROM student_preferences sp
+            JOIN users u ON sp.student_id = u.id
+            JOIN classes c ON u.class_id = c.id
+            WHERE u.role = 'student' AND u.deleted_at IS NULL {dept_filter}
+        """, params)
+        for student_id, order, company_id in cursor.fetchall():
+            s, c = student_index.get(student_id), company_index.get(company_id)
+            if s is not None and c is not None and 1 <= order <= MAX_PREFERENCES:
+                prefs[s * MAX_PREFERENCES + order - 1] = c
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {
+        "student_ids": student_ids,
+        "company_ids": company_ids,
+        "capacities": capacities,
+        "prefs": prefs,
+    }
+
+
+def build_ranking(problem, priorities=None, seed=None):
+    """priority 預設皆為 0，同分以固定 seed 抽籤，方便重現結果"""
+    priorities = priorities or {}
+    student_ids = problem["student_ids"]
+    priority = array('d', (float(priorities.get(sid, 0)) for sid in student_ids))
+    lottery = array('i', range(len(student_ids)))
+    random.Random(seed).shuffle(lottery)
+    return priority, lottery
+
+
+def apply_capacity_overrides(problem, overrides):
+    """{company_id: capacity}；回傳新的名額陣列，不修改原本的 problem"""
+    capacities = array('i', problem["capacities"])
+    if overrides:
+        index = {cid: i for i, cid in enumerate(problem["company_ids"])}
+        for company_id, capacity in overrides.items():
+            c = index.get(int(company_id))
+            if c is not None:
+                capacities[c] = max(0, int(capacity))
+    return capacities
+
+# -------------------------
+# 執行並寫入結果
+# -------------------------
+def run_allocation(department=None, capacities=None, priorities=None, seed=None, created_by=None):
+    if seed is None:
+        seed = random.randrange(2 ** 31)   # 記錄實際使用的 seed，結果可重現
+    problem = load_problem(department)
+    capacity_array = apply_capacity_overrides(problem, capacities)
+    priority, lottery = build_ranking(problem, priorities, seed)
+    assigned, rank = deferred_acceptance(problem["prefs"], capacity_array, priority, lottery)
+
+    student_ids, company_ids = problem["student_ids"], problem["company_ids"]
+    rows = [(student_ids[s], company_ids[assigned[s]] if assigned[s] != NO_COMPANY else None, rank[s] or None)
+            for s in range(len(student_ids))]
+    matched = sum(1 for _, company_id, _ in rows if company_id is not None)
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO placement_runs (department, seed, created_by, created_at, total_students, matched)
+            VALUES (%s, %s, %s, NOW(), %s, %s)
+        """, (department, seed, created_by, len(rows), matched))
+        run_id = cursor.lastrowid
+        for i in range(0, len(rows), INSERT_BATCH_SIZE):
+            cursor.executemany("""
+                INSERT INTO placements (run_id, student_id, company_id, preference_rank)
+                VALUES (%s, %s, %s, %s)
+            """, [(run_id,) + row for row in rows[i:i + INSERT_BATCH_SIZE]])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {
+        "run_id": run_id,
+        "seed": seed,
+        "total_students": len(rows),
+        "matched": matched,
+        "unmatched": len(rows) - matched,
+    }
+
+# -------------------------
+# 模擬：多組名額情境平行試算，不寫入任何分發結果
+# -------------------------
+def _get_sim_pool():
+    global _sim_pool
+    with _sim_pool_lock:
+        if _sim_pool is None:
+            _sim_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2)
+        return _sim_pool
+
+
+def _share(values):
+    """把 array 複製進共享記憶體一次，各 worker 只依名稱掛載，不再逐一序列化"""
+    shm = shared_memory.SharedMemory(create=True, size=max(len(values) * values.itemsize, 1))
+    shm.buf[:len(values) * values.itemsize] = values.tobytes()
+    return shm
+
+
+def _simulate_scenario(names, typecodes, lengths, capacities):
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    views = [block.buf.cast(code)[:length] for block, code, length in zip(blocks, typecodes, lengths)]
+    try:
+        prefs, priority, lottery = views
+        assigned, rank = deferred_acceptance(prefs, capacities, priority, lottery)
+    finally:
+        # 共享記憶體關閉前必須先釋放所有 memoryview
+        for view in views:
+            view.release()
+        for block in blocks:
+            block.close()
+
+    filled = array('i', bytes(4 * len(capacities)))
+    for c in assigned:
+        if c != NO_COMPANY:
+            filled[c] += 1
+    matched = len(assigned) - assigned.count(NO_COMPANY)
+    total_capacity = sum(capacities)
+    return {
+        "matched": matched,
+        "unmatched": len(assigned) - matched,
+        "first_choice": rank.count(1),
+        "fill_rate": round(matched / total_capacity, 4) if total_capacity else 0,
+        "filled": filled,
+    }
+
+
+def _unallocated(total_students, capacities):
+    """沒有學生或沒有名額時不必實際分發，所有學生皆未分發"""
+    return {
+        "matched": 0,
+        "unmatched": total_students,
+        "first_choice": 0,
+        "fill_rate": 0,
+        "filled": array('i', bytes(4 * len(capacities))),
+    }
+
+
+def simulate(scenarios, department=None, priorities=None, seed=None):
+    """
+    scenarios: [{"name": ..., "capacities": {company_id: capacity}}]
+    每個情境以目前名額為基準套用覆寫；回傳各情境的填滿率與未分發人數
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    problem = load_problem(department)
+    total_students = len(problem["student_ids"])
+    capacity_sets = [apply_capacity_overrides(problem, scenario.get("capacities")) for scenario in scenarios]
+    outcomes = [_unallocated(total_students, capacities) for capacities in capacity_sets]
+    # 沒有學生時共享記憶體為空，無法 cast；沒有名額的情境也不必送進 worker
+    pending = [i for i, capacities in enumerate(capacity_sets) if total_students and sum(capacities)]
+
+    if pending:
+        priority, lottery = build_ranking(problem, priorities, seed)
+        shared = [problem["prefs"], priority, lottery]
+        blocks = [_share(values) for values in shared]
+        try:
+            names = [block.name for block in blocks]
+            typecodes = [values.typecode for values in shared]
+            lengths = [len(values) for values in shared]
+            futures = {i: _get_sim_pool().submit(_simulate_scenario, names, typecodes, lengths, capacity_sets[i])
+                       for i in pending}
+            for i, future in futures.items():
+                outcomes[i] = future.result()
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    company_ids = problem["company_ids"]
+    results = []
+    for scenario, capacities, outcome in zip(scenarios, capacity_sets, outcomes):
+        filled = outcome.pop("filled")
+        overridden = {int(company_id) for company_id in (scenario.get("capacities") or {})}
+        outcome["name"] = scenario.get("name")
+        outcome["companies"] = [
+            {"company_id": company_ids[c], "capacity": capacities[c], "filled": filled[c]}
+            for c in range(len(company_ids)) if company_ids[c] in overridden
+        ]
+        results.append(outcome)
+    return {"seed": seed, "total_students": total_students, "scenarios": results}
+
+# -------------------------
+# API - 執行分發 / 查詢結果
+# -------------------------
+@allocation_bp.route('/api/allocations', methods=['POST'])
+def create_allocation():
+    if 'user_id' not in session or session.get('role') not in ("director", "admin"):
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        result = run_allocation(
+            department=data.get("department"),
+            capacities=data.get("capacities"),
+            priorities={int(k): v for k, v in (data.get("priorities") or {}).items()},
+            seed=data.get("seed"),
+            created_by=session['user_id'],
+        )
+        return jsonify({"success": True, **result})
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "參數格式錯誤"}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"分發失敗: {str(e)}"}), 500
+
+
+@allocation_bp.route('/api/allocations/<int:run_id>', methods=['GET'])
+def get_allocation(run_id):
+    if 'user_id' not in session or session.get('role') not in ("director", "admin", "teacher"):
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT * FROM placement_runs WHERE id = %s", (run_id,))
+        run = cursor.fetchone()
+        if not run:
+            return jsonify({"success": False, "message": "查無此分發結果"}), 404
+        run["created_at"] = run["created_at"].strftime("%Y-%m-%d %H:%M:%S")
+
+        cursor.execute("""
+            SELECT p.student_id, u.username, u.name AS student_name, c.name AS class_name,
+                   p.company_id, ic.company_name, p.preference_rank
+            FROM placements p
+            JOIN users u ON p.student_id = u.id
+            LEFT JOIN classes c ON u.class_id = c.id
+            LEFT JOIN internship_companies ic ON p.company_id = ic.id
+            WHERE p.run_id = %s
+            ORDER BY c.name, u.username
+        """, (run_id,))
+        return jsonify({"success": True, "run": run, "placements": cursor.fetchall()})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"查詢失敗: {str(e)}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@allocation_bp.route('/api/allocations/simulate', methods=['POST'])
+def simulate_allocation():
+    if 'user_id' not in session or session.get('role') not in ("director", "admin"):
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    data = request.get_json(silent=True) or {}
+    # 第一個情境固定為目前名額，方便比較
+    scenarios = [{"name": "目前名額", "capacities": {}}] + list(data.get("scenarios") or [])
+    if len(scenarios) > MAX_SCENARIOS + 1:
+        return jsonify({"success": False, "message": f"最多 {MAX_SCENARIOS} 個情境"}), 400
+
+    try:
+        result = simulate(
+            scenarios,
+            department=data.get("department"),
+            priorities={int(k): v for k, v in (data.get("priorities") or {}).items()},
+            seed=data.get("seed"),
+        )
+        return jsonify({"success": True, **result})
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({"success": False, "message": "參數格式錯誤"}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"模擬失敗: {str(e)}"}), 500
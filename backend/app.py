@@ -38,6 +38,13 @@ from admin import admin_bp
 from users import users_bp
 from notification import notification_bp
 from preferences import preferences_bp
+from resume_search import resume_search_bp
+from resume_thumbnail import resume_thumbnail_bp
+from resume_similarity import resume_similarity_bp
+from resume_stats import resume_stats_bp
+from reports import reports_bp
+from allocation import allocation_bp
+from company_demand import company_demand_bp
 
 # 註冊 Blueprint
 app.register_blueprint(auth_bp)
@@ -47,6 +54,17 @@ app.register_blueprint(admin_bp)
 app.register_blueprint(users_bp)
 app.register_blueprint(notification_bp)
 app.register_blueprint(preferences_bp)
+app.register_blueprint(resume_search_bp)
+app.register_blueprint(resume_thumbnail_bp)
+app.register_blueprint(resume_similarity_bp)
+app.register_blueprint(resume_stats_bp)
+app.register_blueprint(reports_bp)
+app.register_blueprint(allocation_bp)
+app.register_blueprint(company_demand_bp)
+
+# 管理員首頁統計定期校正
+import dashboard
+dashboard.start_reconciler()
 
 # -------------------------
 # 首頁路由（使用者前台）
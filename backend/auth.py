@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, render_template, session, redirect, url_for
 from werkzeug.security import check_password_hash, generate_password_hash
 from config import get_db
+import dashboard
 import json
 import re
 
@@ -22,7 +23,7 @@ def login():
     cursor = conn.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+        cursor.execute("SELECT * FROM users WHERE username = %s AND deleted_at IS NULL", (username,))
         users = cursor.fetchall()
 
         if not users:
@@ -174,6 +175,7 @@ def register_student():
             "INSERT INTO users (username, password, email, role) VALUES (%s, %s, %s, %s)",
             (username, hashed_password, email, role)
         )
+        dashboard.bump_user(cursor, role, None, 1)
         conn.commit()
         cursor.close()
         conn.close()
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, render_template, session
 from config import get_db
+import dashboard
 from datetime import datetime
 
 company_bp = Blueprint("company_bp", __name__)
@@ -44,6 +45,7 @@ def upload_company_form():
                 contact_phone,
                 uploaded_by_user_id
             ))
+            dashboard.bump(cursor, "companies_by_status", "pending", 1)
             conn.commit()
             cursor.close()
             conn.close()
@@ -95,6 +97,8 @@ def api_approve_company():
             SET status = %s, reviewed_at = %s
             WHERE id = %s
         """, (status, reviewed_at, company_id))
+        dashboard.bump(cursor, "companies_by_status", current_status, -1)
+        dashboard.bump(cursor, "companies_by_status", status, 1)
 
         conn.commit()
 
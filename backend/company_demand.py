@@ -0,0 +1,142 @@
+from flask import Blueprint, jsonify, session
+from config import get_db
+import traceback
+
+company_demand_bp = Blueprint("company_demand_bp", __name__)
+
+# 依 (公司, 班級) 統計志願熱門度：第一志願、前三志願、任一志願被選的次數。
+# 由 preferences.save_preferences 在同一交易中依差異增減，學生換班時整批移到新班級；
+# 沒有班級的學生記在 class_id = 0。
+# 以下函式皆接收呼叫端的 cursor，不自行 commit。
+
+TOP_N = 3
+
+
+def _deltas(prefs, sign, deltas):
+    for order, company_id in prefs.items():
+        counts = deltas.setdefault(company_id, [0, 0, 0])
+        counts[0] += sign if order == 1 else 0
+        counts[1] += sign if order <= TOP_N else 0
+        counts[2] += sign
+
+
+def on_preferences_changed(cursor, class_id, old, new):
+    """old / new: {preference_order: company_id}"""
+    deltas = {}
+    _deltas(old, -1, deltas)
+    _deltas(new, 1, deltas)
+    rows = [(company_id, class_id or 0, first, top, any_rank)
+            for company_id, (first, top, any_rank) in sorted(deltas.items())
+            if first or top or any_rank]
+    if rows:
+        cursor.executemany("""
+            INSERT INTO company_demand (company_id, class_id, first_choice, top3, any_rank)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE first_choice = first_choice + VALUES(first_choice),
+                                    top3 = top3 + VALUES(top3),
+                                    any_rank = any_rank + VALUES(any_rank)
+        """, rows)
+
+
+def on_class_change(cursor, user_id, old_class, new_class):
+    """學生換班時呼叫（users 列須已鎖定），將其目前志願的統計由舊班級移到新班級"""
+    if (old_class or 0) == (new_class or 0):
+        return
+    cursor.execute("""
+        SELECT preference_order, company_id FROM student_preferences
+        WHERE student_id = %s
+    """, (user_id,))
+    prefs = {order: company_id for order, company_id in cursor.fetchall()}
+    if prefs:
+        on_preferences_changed(cursor, old_class, prefs, {})
+        on_preferences_changed(cursor, new_class, {}, prefs)
+
+
+def on_user_removed(cursor, user_id):
+    """刪除學生志願前呼叫"""
+    cursor.execute("""
+        SELECT u.class_id, sp.preference_order, sp.company_id
+        FROM student_preferences sp
+        JOIN users u ON u.id = sp.student_id
+        WHERE sp.student_id = %s
+    """, (user_id,))
+    rows = cursor.fetchall()
+    if rows:
+        on_preferences_changed(cursor, rows[0][0], {order: company_id for _, order, company_id in rows}, {})
+
+
+def rebuild():
+    """由 student_preferences 全量重建統計表，用於修正偏差"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM company_demand")
+        cursor.execute("""
+            INSERT INTO company_demand (company_id, class_id, first_choice, top3, any_rank)
+            SELECT sp.company_id, COALESCE(u.class_id, 0),
+                   SUM(sp.preference_order = 1), SUM(sp.preference_order <= %s), COUNT(*)
+            FROM student_preferences sp
+            JOIN users u ON u.id = sp.student_id
+            GROUP BY sp.company_id, COALESCE(u.class_id, 0)
+        """, (TOP_N,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+        conn.close()
+
+# -------------------------
+# API - 公司志願熱門度（主任）
+# -------------------------
+@company_demand_bp.route('/api/company_demand', methods=['GET'])
+def company_demand():
+    if 'user_id' not in session or session.get('role') not in ("director", "admin"):
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT d.company_id, ic.company_name, ic.capacity, d.class_id, c.name AS class_name,
+                   d.first_choice, d.top3, d.any_rank
+            FROM company_demand d
+            JOIN internship_companies ic ON ic.id = d.company_id
+            LEFT JOIN classes c ON c.id = d.class_id
+            WHERE d.any_rank > 0
+            ORDER BY d.company_id, d.class_id
+        """)
+        companies = {}
+        for row in cursor.fetchall():
+            company = companies.setdefault(row['company_id'], {
+                "company_id": row['company_id'],
+                "company_name": row['company_name'],
+                "capacity": row['capacity'],
+                "first_choice": 0, "top3": 0, "any_rank": 0,
+                "classes": [],
+            })
+            for key in ("first_choice", "top3", "any_rank"):
+                company[key] += int(row[key])
+            company["classes"].append({
+                "class_id": row['class_id'] or None,
+                "class_name": row['class_name'],
+                "first_choice": row['first_choice'],
+                "top3": row['top3'],
+                "any_rank": row['any_rank'],
+            })
+
+        # 第一志願人數多者排前面，並標示超額（第一志願人數大於名額）
+        result = sorted(companies.values(), key=lambda c: (-c["first_choice"], -c["any_rank"]))
+        for company in result:
+            company["oversubscribed"] = bool(company["capacity"]) and company["first_choice"] > company["capacity"]
+        return jsonify({"success": True, "companies": result})
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    print(f"已重建 {rebuild()} 筆公司志願統計")
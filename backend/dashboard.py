@@ -0,0 +1,104 @@
+from config import get_db
+import threading
+import time
+import traceback
+
+# 管理員首頁統計：由各寫入流程在同一交易中遞增 / 遞減，
+# 並定期以 GROUP BY 全量校正，避免漏接的寫入路徑造成偏差。
+#   users_by_role       dim = 角色
+#   students_by_class   dim = class_id
+#   resumes_by_status   dim = 最新且未刪除履歷的狀態
+#   companies_by_status dim = 公司審核狀態
+
+RECONCILE_INTERVAL_SECONDS = 3600
+
+RECONCILE_QUERIES = {
+    "users_by_role": """
+        SELECT role, COUNT(*) FROM users WHERE deleted_at IS NULL GROUP BY role
+    """,
+    "students_by_class": """
+        SELECT class_id, COUNT(*) FROM users
+        WHERE role = 'student' AND class_id IS NOT NULL AND deleted_at IS NULL
+        GROUP BY class_id
+    """,
+    "resumes_by_status": """
+        SELECT status, COUNT(*) FROM resumes WHERE is_latest = 1 AND deleted_at IS NULL GROUP BY status
+    """,
+    "companies_by_status": """
+        SELECT status, COUNT(*) FROM internship_companies GROUP BY status
+    """,
+}
+
+_reconciler = None
+_reconciler_lock = threading.Lock()
+
+
+def bump(cursor, metric, dim, delta=1):
+    """在呼叫端交易中調整計數，不自行 commit"""
+    if dim is None or not delta:
+        return
+    cursor.execute("""
+        INSERT INTO dashboard_counters (metric, dim, value)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+    """, (metric, str(dim), delta))
+
+
+def bump_user(cursor, role, class_id, delta):
+    bump(cursor, "users_by_role", role, delta)
+    if role == "student":
+        bump(cursor, "students_by_class", class_id, delta)
+
+
+def reconcile():
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        for metric, sql in RECONCILE_QUERIES.items():
+            cursor.execute(sql)
+            rows = [(metric, str(dim), value) for dim, value in cursor.fetchall() if dim is not None]
+            cursor.execute("DELETE FROM dashboard_counters WHERE metric = %s", (metric,))
+            if rows:
+                cursor.executemany("""
+                    INSERT INTO dashboard_counters (metric, dim, value) VALUES (%s, %s, %s)
+                """, rows)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _reconcile_loop():
+    while True:
+        try:
+            reconcile()
+        except Exception:
+            traceback.print_exc()
+        time.sleep(RECONCILE_INTERVAL_SECONDS)
+
+
+def start_reconciler():
+    global _reconciler
+    with _reconciler_lock:
+        if _reconciler is None:
+            _reconciler = threading.Thread(target=_reconcile_loop, name="dashboard-reconcile", daemon=True)
+            _reconciler.start()
+
+
+def get_counters():
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT metric, dim, value FROM dashboard_counters")
+        counters = {metric: {} for metric in RECONCILE_QUERIES}
+        for metric, dim, value in cursor.fetchall():
+            counters.setdefault(metric, {})[dim] = value
+        return counters
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    reconcile()
+    print("已重新計算管理員首頁統計")
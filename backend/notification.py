@@ -1,52 +1,388 @@
-from flask import Blueprint, render_template, jsonify
-from datetime import datetime
+from flask import Blueprint, render_template, request, jsonify, session, current_app, Response, stream_with_context
+from datetime import datetime, timedelta
+import hashlib
 import json
+import threading
 from config import get_db
+import notification_views
+import notification_push
+import notification_reads
 
 notification_bp = Blueprint("notification", __name__, url_prefix="/notifications")
 
-@notification_bp.route('/')
-def notifications():
-    return render_template('user_shared/notifications.html')
+ANNOUNCER_ROLES = ("admin", "director", "ta")
+# 公告對象以位元遮罩存放（target_role_mask），未指定對象視為全部角色
+ROLE_BITS = {"student": 1, "teacher": 2, "director": 4, "ta": 8, "admin": 16}
+ALL_ROLES_MASK = sum(ROLE_BITS.values())
+NOTIFICATION_STATUSES = ("draft", "published", "archived")
+# 單次回報瀏覽的公告數上限
+MAX_VIEW_IDS = 100
+# 正常情況下依 visible_from / visible_until 邊界失效；此上限只為涵蓋直接改資料庫的情況
+CACHE_MAX_AGE = timedelta(minutes=10)
 
-@notification_bp.route("/api/notification", methods=["GET"])
-def get_notification():
+# -------------------------
+# 公告快取：依角色分開，只在下一個可見時間邊界或發布 / 編輯時失效
+# -------------------------
+_cache = {}
+_cache_generation = 0
+_cache_lock = threading.Lock()
+
+
+def role_mask(roles):
+    mask = 0
+    for role in roles or []:
+        mask |= ROLE_BITS.get(role, 0)
+    return mask or ALL_ROLES_MASK
+
+
+def _masks_for(role):
+    """包含該角色位元的所有遮罩值；以 IN 列舉讓 (status, target_role_mask) 索引可用"""
+    bit = ROLE_BITS.get(role)
+    if bit is None:
+        return [ALL_ROLES_MASK]
+    return [mask for mask in range(1, ALL_ROLES_MASK + 1) if mask & bit]
+
+
+def _format_row(row):
+    row["created_at"] = row["created_at"].strftime("%Y-%m-%d %H:%M:%S")
+    row["visible_from"] = row["visible_from"].strftime("%Y-%m-%d %H:%M:%S") if row["visible_from"] else None
+    row["visible_until"] = row["visible_until"].strftime("%Y-%m-%d %H:%M:%S") if row["visible_until"] else None
+    row["source"] = row.pop("created_by") or "平台"
+    try:
+        row["target_roles"] = json.loads(row["target_roles"]) if row["target_roles"] else []
+    except ValueError:
+        row["target_roles"] = []
+    return row
+
+
+def _load_announcements(role, now):
+    masks = _masks_for(role)
+    placeholders = ','.join(['%s'] * len(masks))
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
     try:
-        now = datetime.now()
-        cursor.execute("""
-            SELECT 
-                id, title, content, created_by, created_at,
+        cursor.execute(f"""
+            SELECT
+                id, title, content, created_by, created_at, published_at,
                 target_roles, status, visible_from, visible_until,
                 is_important, view_count
             FROM notification
             WHERE status = 'published'
+              AND target_role_mask IN ({placeholders})
               AND (visible_from IS NULL OR visible_from <= %s)
               AND (visible_until IS NULL OR visible_until >= %s)
             ORDER BY is_important DESC, created_at DESC
-        """, (now, now))
+        """, masks + [now, now])
         rows = cursor.fetchall()
 
-        for row in rows:
-            row["created_at"] = row["created_at"].strftime("%Y-%m-%d %H:%M:%S")
-            row["visible_from"] = row["visible_from"].strftime("%Y-%m-%d %H:%M:%S") if row["visible_from"] else None
-            row["visible_until"] = row["visible_until"].strftime("%Y-%m-%d %H:%M:%S") if row["visible_until"] else None
-            row["source"] = row.pop("created_by") or "平台"
+        # 下一則即將上架的公告
+        cursor.execute(f"""
+            SELECT MIN(visible_from) AS next_from
+            FROM notification
+            WHERE status = 'published' AND target_role_mask IN ({placeholders}) AND visible_from > %s
+        """, masks + [now])
+        next_from = cursor.fetchone()["next_from"]
+    finally:
+        cursor.close()
+        conn.close()
+
+    # 快取在最早的上架時間或下架時間（visible_until 之後）失效
+    expires_at = now + CACHE_MAX_AGE
+    if next_from:
+        expires_at = min(expires_at, next_from)
+    for row in rows:
+        if row["visible_until"]:
+            expires_at = min(expires_at, row["visible_until"] + timedelta(microseconds=1))
+
+    # 已讀狀態的排序鍵：開始可見的時間（發布或上架較晚者），見 notification_reads
+    read_keys = []
+    for row in rows:
+        published_at = row.pop("published_at") or row["created_at"]
+        read_keys.append((max(published_at, row["visible_from"] or published_at), row["id"]))
+
+    announcements = [_format_row(row) for row in rows]
+    body = json.dumps(announcements, ensure_ascii=False, sort_keys=True, default=str)
+    return {
+        "announcements": announcements,
+        "read_keys": sorted(read_keys),
+        "etag": hashlib.md5(body.encode("utf-8")).hexdigest(),
+        "expires_at": expires_at,
+    }
+
 
-            if row["target_roles"]:
-                try:
-                    row["target_roles"] = json.loads(row["target_roles"])
-                except Exception:
-                    row["target_roles"] = []
-            else:
-                row["target_roles"] = []
+def get_announcements(role):
+    """回傳該角色目前可見公告的快取（announcements, etag）"""
+    now = datetime.now()
+    with _cache_lock:
+        cached, generation = _cache.get(role), _cache_generation
+    if cached and now < cached["expires_at"]:
+        return cached
 
-        return jsonify({"success": True, "announcements": rows})
+    fresh = _load_announcements(role, now)
+    with _cache_lock:
+        # 載入期間若有發布 / 編輯，不覆蓋成較舊的結果
+        if generation == _cache_generation:
+            _cache[role] = fresh
+    return fresh
+
+
+def invalidate_cache():
+    global _cache_generation
+    with _cache_lock:
+        _cache.clear()
+        _cache_generation += 1
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise ValueError("時間格式錯誤")
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("時間格式錯誤")
+
+
+@notification_bp.route('/')
+def notifications():
+    return render_template('user_shared/notifications.html')
+
+@notification_bp.route("/api/notification", methods=["GET"])
+def get_notification():
+    try:
+        cached = get_announcements(session.get("role"))
+        if request.if_none_match.contains(cached["etag"]):
+            response = current_app.response_class(status=304)
+        else:
+            response = jsonify({"success": True, "announcements": cached["announcements"]})
+        response.set_etag(cached["etag"])
+        response.headers["Cache-Control"] = "no-cache"
+        return response
 
     except Exception as e:
         print("❌ 取得公告失敗：", e)
         return jsonify({"success": False, "message": "取得公告失敗"}), 500
+
+# -------------------------
+# API - 發布 / 編輯公告
+# -------------------------
+def _read_notification_form(data):
+    status = data.get("status", "published")
+    if status not in NOTIFICATION_STATUSES:
+        raise ValueError("無效的公告狀態")
+    visible_from = _parse_time(data.get("visible_from"))
+    visible_until = _parse_time(data.get("visible_until"))
+    if visible_from and visible_until and visible_until < visible_from:
+        raise ValueError("下架時間早於上架時間")
+    return {
+        "title": (data.get("title") or "").strip(),
+        "content": data.get("content") or "",
+        "target_roles": json.dumps(data.get("target_roles") or [], ensure_ascii=False),
+        "target_role_mask": role_mask(data.get("target_roles")),
+        "status": status,
+        "visible_from": visible_from,
+        "visible_until": visible_until,
+        "is_important": 1 if data.get("is_important") else 0,
+    }
+
+
+def _push_change(notification_id, form, old_mask=0):
+    """發布 / 編輯後推播給已連線頁面；不在可見期間內視為撤下"""
+    now = datetime.now()
+    visible = (form["status"] == "published"
+               and (form["visible_from"] is None or form["visible_from"] <= now)
+               and (form["visible_until"] is None or form["visible_until"] >= now))
+    new_mask = form["target_role_mask"]
+    if not visible:
+        notification_push.publish("retracted", {"id": notification_id}, old_mask | new_mask)
+        return
+    notification_push.publish("published", {
+        "id": notification_id,
+        "title": form["title"],
+        "content": form["content"],
+        "is_important": form["is_important"],
+        "visible_until": form["visible_until"].strftime("%Y-%m-%d %H:%M:%S") if form["visible_until"] else None,
+    }, new_mask)
+    if old_mask & ~new_mask:
+        notification_push.publish("retracted", {"id": notification_id}, old_mask & ~new_mask)
+
+
+@notification_bp.route("/api/notification", methods=["POST"])
+def create_notification():
+    if session.get("role") not in ANNOUNCER_ROLES:
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    try:
+        form = _read_notification_form(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e) or "時間格式錯誤"}), 400
+    if not form["title"]:
+        return jsonify({"success": False, "message": "請輸入公告標題"}), 400
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO notification
+                (title, content, created_by, created_at, published_at, target_roles, target_role_mask, status,
+                 visible_from, visible_until, is_important, view_count)
+            VALUES (%s, %s, %s, NOW(), IF(%s = 'published', NOW(6), NULL), %s, %s, %s, %s, %s, %s, 0)
+        """, (form["title"], form["content"], session.get("username"), form["status"], form["target_roles"],
+              form["target_role_mask"], form["status"],
+              form["visible_from"], form["visible_until"], form["is_important"]))
+        conn.commit()
+        notification_id = cursor.lastrowid
+    except Exception as e:
+        print("❌ 發布公告失敗：", e)
+        return jsonify({"success": False, "message": "發布公告失敗"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+    invalidate_cache()
+    _push_change(notification_id, form)
+    return jsonify({"success": True, "message": "公告已發布", "id": notification_id})
+
+
+@notification_bp.route("/api/notification/<int:notification_id>", methods=["PUT"])
+def update_notification(notification_id):
+    if session.get("role") not in ANNOUNCER_ROLES:
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    try:
+        form = _read_notification_form(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e) or "時間格式錯誤"}), 400
+    if not form["title"]:
+        return jsonify({"success": False, "message": "請輸入公告標題"}), 400
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT target_role_mask FROM notification WHERE id = %s", (notification_id,))
+        old = cursor.fetchone()
+        if not old:
+            return jsonify({"success": False, "message": "公告不存在"}), 404
+
+        cursor.execute("""
+            UPDATE notification
+            SET published_at = IF(status <> 'published' AND %s = 'published', NOW(6), published_at),
+                title = %s, content = %s, target_roles = %s, target_role_mask = %s, status = %s,
+                visible_from = %s, visible_until = %s, is_important = %s
+            WHERE id = %s
+        """, (form["status"], form["title"], form["content"], form["target_roles"], form["target_role_mask"], form["status"],
+              form["visible_from"], form["visible_until"], form["is_important"], notification_id))
+        conn.commit()
+    except Exception as e:
+        print("❌ 更新公告失敗：", e)
+        return jsonify({"success": False, "message": "更新公告失敗"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+    invalidate_cache()
+    _push_change(notification_id, form, old[0])
+    return jsonify({"success": True, "message": "公告已更新"})
+
+# -------------------------
+# API - 已讀狀態與未讀數
+# -------------------------
+@notification_bp.route("/api/unread_count", methods=["GET"])
+def unread_count():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "請先登入"}), 401
+
+    try:
+        read_keys = get_announcements(session.get("role"))["read_keys"]
+        unread, unread_ids = notification_reads.read_state(session['user_id'], read_keys)
+        return jsonify({"success": True, "unread": unread, "unread_ids": unread_ids})
+    except Exception as e:
+        print("❌ 取得未讀數失敗：", e)
+        return jsonify({"success": False, "message": "取得未讀數失敗"}), 500
+
+
+@notification_bp.route("/api/notification/read", methods=["POST"])
+def mark_notifications_read():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "請先登入"}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        read_keys = get_announcements(session.get("role"))["read_keys"]
+        if data.get("all"):
+            notification_reads.mark_all_read(session['user_id'], read_keys)
+        else:
+            ids = [i for i in data.get("ids", []) if isinstance(i, int)]
+            notification_reads.mark_read(session['user_id'], ids, read_keys)
+        return jsonify({"success": True})
+    except Exception as e:
+        print("❌ 更新已讀狀態失敗：", e)
+        return jsonify({"success": False, "message": "更新已讀狀態失敗"}), 500
+
+# -------------------------
+# API - 即時推播（SSE）
+# -------------------------
+@notification_bp.route("/api/stream", methods=["GET"])
+def notification_stream():
+    role_bit = ROLE_BITS.get(session.get("role"))
+    if role_bit is None:
+        return jsonify({"success": False, "message": "請先登入"}), 401
+
+    response = Response(stream_with_context(notification_push.stream(role_bit)), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# -------------------------
+# API - 瀏覽紀錄與觸及統計
+# -------------------------
+@notification_bp.route("/api/notification/views", methods=["POST"])
+def record_notification_views():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "請先登入"}), 401
+
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids") or []
+    if not isinstance(ids, list) or len(ids) > MAX_VIEW_IDS:
+        return jsonify({"success": False, "message": "參數格式錯誤"}), 400
+
+    try:
+        # 只記錄該角色目前看得到的公告，避免任意 id 佔用統計
+        visible = {key[1] for key in get_announcements(session.get("role"))["read_keys"]}
+        ids = {i for i in ids if isinstance(i, int) and i in visible}
+        if ids:
+            notification_views.record_views(ids, session['user_id'])
+        return jsonify({"success": True})
+    except Exception as e:
+        print("❌ 記錄瀏覽失敗：", e)
+        return jsonify({"success": False, "message": "記錄瀏覽失敗"}), 500
+
+
+@notification_bp.route("/api/notification_reach", methods=["GET"])
+def notification_reach():
+    if session.get("role") not in ANNOUNCER_ROLES:
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT n.id, n.title, n.status, n.is_important, n.view_count,
+                   COALESCE(r.unique_viewers, 0) AS unique_viewers
+            FROM notification n
+            LEFT JOIN notification_reach r ON r.notification_id = n.id
+            ORDER BY n.created_at DESC
+            LIMIT 100
+        """)
+        rows = cursor.fetchall()
+        for row in rows:
+            # 尚未寫回的瀏覽次數
+            row["view_count"] += notification_views.pending_views(row["id"])
+        return jsonify({"success": True, "notifications": rows})
+    except Exception as e:
+        print("❌ 取得公告統計失敗：", e)
+        return jsonify({"success": False, "message": "取得公告統計失敗"}), 500
     finally:
         cursor.close()
         conn.close()
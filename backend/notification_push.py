@@ -0,0 +1,64 @@
+import json
+import queue
+import threading
+
+# 公告即時推播（SSE）：每個 worker 一個發布者，依角色遮罩分送給已連線的頁面。
+# 每個連線只有固定大小的緩衝，收不及時丟掉最舊的事件並改送 resync，
+# 讓前端重新抓取完整公告列表，不會因慢速連線讓記憶體無限制成長。
+
+CLIENT_BUFFER_SIZE = 32
+HEARTBEAT_SECONDS = 25
+
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+
+
+class _Subscriber:
+    def __init__(self, role_bit):
+        self.role_bit = role_bit
+        self.events = queue.Queue(maxsize=CLIENT_BUFFER_SIZE)
+
+    def offer(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.events.put_nowait(("resync", {}))
+            except queue.Full:
+                pass
+
+
+def publish(event, payload, mask):
+    """分送給角色位元落在 mask 內的連線"""
+    with _subscribers_lock:
+        targets = [s for s in _subscribers if s.role_bit & mask]
+    for subscriber in targets:
+        subscriber.offer((event, payload))
+
+
+def stream(role_bit):
+    """SSE 產生器；連線中斷時由 GeneratorExit 觸發 finally 取消訂閱"""
+    subscriber = _Subscriber(role_bit)
+    with _subscribers_lock:
+        _subscribers.add(subscriber)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event, payload = subscriber.events.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+    finally:
+        with _subscribers_lock:
+            _subscribers.discard(subscriber)
+
+
+def subscriber_count():
+    with _subscribers_lock:
+        return len(_subscribers)
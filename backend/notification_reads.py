@@ -0,0 +1,111 @@
+from config import get_db
+from array import array
+from bisect import bisect_right
+
+# 公告已讀狀態：每位使用者一列。
+# 公告以「開始可見時間」排序，鍵值為 (visible_since, id)：
+#   visible_since = max(published_at, visible_from)，排程或重新發布的公告會排在較後面。
+#   high_water_at / high_water_id  鍵值 ≤ 此水位的公告全部已讀
+#   read_ids                       水位之上零星已讀的公告 id（32 位元整數陣列）
+# 水位只會越過「當下可見且已讀」的公告，因此之後才上架的公告鍵值必定大於水位，不會被誤判為已讀。
+# 連續已讀時推進水位並移出 read_ids，一般情況下每人只佔幾個 bytes。
+# 未讀數 = 可見公告中鍵值大於水位者（有序鍵值上二分搜尋）扣掉 read_ids 內的可見公告。
+
+MAX_READ_IDS = 1024   # read_ids VARBINARY(4096) / 4 bytes
+
+
+def _decode(data):
+    ids = array('I')
+    ids.frombytes(data or b"")
+    return set(ids)
+
+
+def _encode(ids):
+    return array('I', sorted(ids)).tobytes()
+
+
+def _compact(high_water, ids, visible_keys):
+    """可見公告依鍵值由小到大連續已讀時推進水位"""
+    start = bisect_right(visible_keys, high_water) if high_water else 0
+    for key in visible_keys[start:]:
+        if key[1] not in ids:
+            break
+        high_water = key
+    passed = {key[1] for key in visible_keys[start:] if key <= high_water}
+    return high_water, ids - passed
+
+
+def _load(cursor, user_id, for_update=False):
+    cursor.execute(f"""
+        SELECT high_water_at, high_water_id, read_ids FROM notification_read_state
+        WHERE user_id = %s {"FOR UPDATE" if for_update else ""}
+    """, (user_id,))
+    row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None, _decode(row[2]) if row else set()
+    return (row[0], row[1]), _decode(row[2])
+
+
+def _save(cursor, user_id, high_water, ids):
+    high_water_at, high_water_id = high_water if high_water else (None, 0)
+    cursor.execute("""
+        INSERT INTO notification_read_state (user_id, high_water_at, high_water_id, read_ids)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE high_water_at = VALUES(high_water_at),
+                                high_water_id = VALUES(high_water_id),
+                                read_ids = VALUES(read_ids)
+    """, (user_id, high_water_at, high_water_id, _encode(ids)))
+
+
+def _above(visible_keys, high_water):
+    return visible_keys[bisect_right(visible_keys, high_water):] if high_water else visible_keys
+
+
+def read_state(user_id, visible_keys):
+    """
+    visible_keys: 目前可見公告的 (visible_since, id)，由小到大
+    回傳 (未讀數, 未讀公告 id)
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        high_water, ids = _load(cursor, user_id)
+    finally:
+        cursor.close()
+        conn.close()
+    unread_ids = [key[1] for key in _above(visible_keys, high_water) if key[1] not in ids]
+    return len(unread_ids), unread_ids
+
+
+def mark_read(user_id, notification_ids, visible_keys):
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        high_water, ids = _load(cursor, user_id, for_update=True)
+        # 只接受目前可見且仍在水位之上的公告，避免任意 id 寫入
+        pending = {key[1] for key in _above(visible_keys, high_water)}
+        ids |= {i for i in notification_ids if i in pending}
+        # 已不可見的公告不再保留（重新發布時鍵值會變大，本來就應視為未讀）
+        high_water, ids = _compact(high_water, ids & pending, visible_keys)
+        if len(ids) > MAX_READ_IDS:
+            ids = set(sorted(ids)[-MAX_READ_IDS:])
+        _save(cursor, user_id, high_water, ids)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def mark_all_read(user_id, visible_keys):
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        high_water, ids = _load(cursor, user_id, for_update=True)
+        if visible_keys and (not high_water or visible_keys[-1] > high_water):
+            high_water = visible_keys[-1]
+        passed = {key[1] for key in visible_keys}
+        _save(cursor, user_id, high_water, ids - passed)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
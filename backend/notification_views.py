@@ -0,0 +1,138 @@
+from config import get_db
+import atexit
+import hashlib
+import math
+import threading
+import time
+import traceback
+
+# 公告瀏覽統計：瀏覽次數先在記憶體累加，定期批次寫回 notification.view_count，
+# 避免每次瀏覽都 UPDATE 同一列；不重複瀏覽人數以 HyperLogLog 估算，
+# 每則公告只存 2^HLL_PRECISION bytes（notification_reach.registers）。
+
+FLUSH_INTERVAL_SECONDS = 10
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+_pending_counts = {}
+_pending_sketches = {}
+_pending_lock = threading.Lock()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+# -------------------------
+# HyperLogLog
+# -------------------------
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _add(registers, value):
+    h = _hash64(value)
+    index = h >> (64 - HLL_PRECISION)
+    rest = h & ((1 << (64 - HLL_PRECISION)) - 1)
+    rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def _merge(target, source):
+    for i, rank in enumerate(source):
+        if rank > target[i]:
+            target[i] = rank
+
+
+def estimate(registers):
+    m = HLL_REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / sum(2.0 ** -r for r in registers)
+    zeros = registers.count(0)
+    if raw <= 2.5 * m and zeros:
+        # 小基數時改用 linear counting
+        return round(m * math.log(m / zeros))
+    return round(raw)
+
+# -------------------------
+# 記錄與寫回
+# -------------------------
+def record_views(notification_ids, viewer_id):
+    with _pending_lock:
+        for notification_id in notification_ids:
+            _pending_counts[notification_id] = _pending_counts.get(notification_id, 0) + 1
+            registers = _pending_sketches.get(notification_id)
+            if registers is None:
+                registers = _pending_sketches[notification_id] = bytearray(HLL_REGISTERS)
+            _add(registers, viewer_id)
+    _ensure_flusher()
+
+
+def flush():
+    with _pending_lock:
+        counts, sketches = dict(_pending_counts), dict(_pending_sketches)
+        _pending_counts.clear()
+        _pending_sketches.clear()
+    if not counts:
+        return
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        # 依 id 排序寫入，多個 worker 同時寫回時不會互相死鎖
+        ids = sorted(counts)
+        cursor.executemany("UPDATE notification SET view_count = view_count + %s WHERE id = %s",
+                           [(counts[i], i) for i in ids])
+
+        placeholders = ','.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            SELECT notification_id, registers FROM notification_reach
+            WHERE notification_id IN ({placeholders})
+            FOR UPDATE
+        """, ids)
+        stored = {notification_id: registers for notification_id, registers in cursor.fetchall()}
+        rows = []
+        for notification_id in ids:
+            registers = sketches[notification_id]
+            if stored.get(notification_id):
+                _merge(registers, bytearray(stored[notification_id]))
+            rows.append((notification_id, bytes(registers), estimate(registers)))
+        cursor.executemany("""
+            INSERT INTO notification_reach (notification_id, registers, unique_viewers)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE registers = VALUES(registers), unique_viewers = VALUES(unique_viewers)
+        """, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        # 寫回失敗時把計數放回，下次再試
+        with _pending_lock:
+            for notification_id, count in counts.items():
+                _pending_counts[notification_id] = _pending_counts.get(notification_id, 0) + count
+                registers = _pending_sketches.setdefault(notification_id, bytearray(HLL_REGISTERS))
+                _merge(registers, sketches[notification_id])
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def pending_views(notification_id):
+    with _pending_lock:
+        return _pending_counts.get(notification_id, 0)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        try:
+            flush()
+        except Exception:
+            traceback.print_exc()
+
+
+def _ensure_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="notification-views", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
@@ -1,10 +1,53 @@
 from flask import Blueprint, request, jsonify, render_template, session, redirect, url_for
 from config import get_db
+import company_demand
 from datetime import datetime
-from collections import defaultdict
+import json
 
 preferences_bp = Blueprint("preferences_bp", __name__)
 
+MAX_PREFERENCES = 5
+
+
+def save_preferences(cursor, student_id, desired):
+    """
+    與既有志願比對後只寫入有變動的志願序，由呼叫端 commit（同一交易）。
+    desired: {preference_order: company_id}；回傳是否有變動。
+    """
+    # 以該生的 users 列作為鎖，重複送出時後到的請求會等前一筆完成再比對。
+    # 不鎖 student_preferences：第一次送出時沒有資料列，FOR UPDATE 會取得間隙鎖，
+    # 兩個請求同時插入會互相死結。
+    cursor.execute("SELECT class_id FROM users WHERE id = %s FOR UPDATE", (student_id,))
+    student = cursor.fetchone()
+    cursor.execute("""
+        SELECT preference_order, company_id
+        FROM student_preferences
+        WHERE student_id = %s
+    """, (student_id,))
+    existing = {row['preference_order']: row['company_id'] for row in cursor.fetchall()}
+
+    removed = [order for order in existing if order not in desired]
+    upserts = [(student_id, order, company_id, datetime.now())
+               for order, company_id in desired.items() if existing.get(order) != company_id]
+    if not removed and not upserts:
+        return False
+
+    company_demand.on_preferences_changed(cursor, student['class_id'] if student else None, existing, desired)
+
+    if removed:
+        placeholders = ','.join(['%s'] * len(removed))
+        cursor.execute(f"""
+            DELETE FROM student_preferences
+            WHERE student_id = %s AND preference_order IN ({placeholders})
+        """, [student_id] + removed)
+    if upserts:
+        cursor.executemany("""
+            INSERT INTO student_preferences (student_id, preference_order, company_id, submitted_at)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE company_id = VALUES(company_id), submitted_at = VALUES(submitted_at)
+        """, upserts)
+    return True
+
 # -------------------------
 # API - 志願填寫
 # -------------------------
@@ -22,28 +65,21 @@ def fill_preferences():
     message = None
 
     if request.method == 'POST':
-        preferences = []
-        for i in range(1, 6):
+        desired = {}
+        for i in range(1, MAX_PREFERENCES + 1):
             company_id = request.form.get(f'preference_{i}')
-            if company_id:
-                preferences.append((student_id, i, company_id, datetime.now()))
+            if company_id and company_id.isdigit():
+                desired[i] = int(company_id)
 
         try:
-            # 刪除舊志願
-            cursor.execute("DELETE FROM student_preferences WHERE student_id = %s", (student_id,))
+            changed = save_preferences(cursor, student_id, desired)
             conn.commit()
-
-            # 新增志願
-            if preferences:
-                cursor.executemany("""
-                    INSERT INTO student_preferences (student_id, preference_order, company_id, submitted_at)
-                    VALUES (%s, %s, %s, %s)
-                """, preferences)
-                conn.commit()
-                message = "✅ 志願序已成功送出"
+            if desired:
+                message = "✅ 志願序已成功送出" if changed else "✅ 志願序未變更"
             else:
                 message = "⚠️ 未選擇任何志願，公司清單已重置"
         except Exception as e:
+            conn.rollback()
             print("寫入志願錯誤：", e)
             message = "❌ 發生錯誤，請稍後再試"
 
@@ -63,11 +99,11 @@ def fill_preferences():
     conn.close()
 
     # 把 prefs 轉成 list，index 對應志願順序 -1
-    submitted_preferences = [None] * 5
+    submitted_preferences = [None] * MAX_PREFERENCES
     for pref in prefs:
         order = pref['preference_order']
         company_id = pref['company_id']
-        if 1 <= order <= 5:
+        if 1 <= order <= MAX_PREFERENCES:
             submitted_preferences[order - 1] = company_id
 
     return render_template('preferences/fill_preferences.html',
@@ -101,58 +137,89 @@ def select_role():
 
 
 # -------------------------
-# 班導查看志願序
+# 班導 / 主任查看志願序
 # -------------------------
+REVIEW_PAGE_SIZE = 50
+
+
 @preferences_bp.route('/review_preferences')
 def review_preferences():
     if 'username' not in session or session.get('role') not in ['teacher', 'director']:
         return redirect(url_for('auth_bp.login_page'))
 
     user_id = session.get('user_id')
+    page = max(request.args.get('page', 1, type=int), 1)
+    selected_class = request.args.get('class_id', type=int)
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
 
     try:
-        # 確認是否為班導
-        cursor.execute("""
-            SELECT c.id AS class_id
-            FROM classes c
-            JOIN classes_teacher ct ON c.id = ct.class_id
-            WHERE ct.teacher_id = %s AND ct.role = '班導師'
-        """, (user_id,))
-        class_info = cursor.fetchone()
-        if not class_info:
+        # 主任看全系，老師看自己擔任班導師的所有班級
+        if session.get('role') == 'director':
+            cursor.execute("SELECT id, name FROM classes ORDER BY name")
+        else:
+            cursor.execute("""
+                SELECT c.id, c.name
+                FROM classes c
+                JOIN classes_teacher ct ON c.id = ct.class_id
+                WHERE ct.teacher_id = %s AND ct.role = '班導師'
+                ORDER BY c.name
+            """, (user_id,))
+        classes = cursor.fetchall()
+        if not classes:
             return "你不是班導，無法查看志願序", 403
 
-        class_id = class_info['class_id']
+        class_ids = [c['id'] for c in classes]
+        if selected_class in class_ids:
+            class_ids = [selected_class]
+        format_strings = ','.join(['%s'] * len(class_ids))
 
-        # 查詢班上學生及其志願
-        cursor.execute("""
-            SELECT 
-                u.id AS student_id,
-                u.name AS student_name,
-                sp.preference_order,
-                ic.company_name,
-                sp.submitted_at
+        cursor.execute(f"""
+            SELECT COUNT(*) AS total FROM users
+            WHERE role = 'student' AND deleted_at IS NULL AND class_id IN ({format_strings})
+        """, class_ids)
+        total = cursor.fetchone()['total']
+
+        # 以學生為單位分頁
+        cursor.execute(f"""
+            SELECT u.id AS student_id, u.username, u.name AS student_name, c.name AS class_name
             FROM users u
-            LEFT JOIN student_preferences sp ON u.id = sp.student_id
-            LEFT JOIN internship_companies ic ON sp.company_id = ic.id
-            WHERE u.class_id = %s
-            ORDER BY u.name, sp.preference_order
-        """, (class_id,))
-        results = cursor.fetchall()
-
-        # 整理資料結構給前端使用
-        student_data = defaultdict(list)
-        for row in results:
-            if row['preference_order'] and row['company_name']:
-                student_data[row['student_name']].append({
-                    'order': row['preference_order'],
-                    'company': row['company_name'],
-                    'submitted_at': row['submitted_at']
-                })
-
-        return render_template('preferences/review_preferences.html', student_data=student_data)
+            JOIN classes c ON u.class_id = c.id
+            WHERE u.role = 'student' AND u.deleted_at IS NULL AND u.class_id IN ({format_strings})
+            ORDER BY c.name, u.username, u.id
+            LIMIT %s OFFSET %s
+        """, class_ids + [REVIEW_PAGE_SIZE, (page - 1) * REVIEW_PAGE_SIZE])
+        students = cursor.fetchall()
+
+        # 每位學生的志願在 SQL 中彙整成一個 JSON 陣列
+        # （此查詢帶參數，SQL 內不可出現 %s，時間以 CAST 轉成 YYYY-MM-DD HH:MM:SS）
+        if students:
+            student_ids = [s['student_id'] for s in students]
+            placeholders = ','.join(['%s'] * len(student_ids))
+            cursor.execute(f"""
+                SELECT sp.student_id,
+                       JSON_ARRAYAGG(JSON_OBJECT(
+                           'order', sp.preference_order,
+                           'company', ic.company_name,
+                           'submitted_at', LEFT(CAST(sp.submitted_at AS CHAR), 19)
+                       )) AS preferences
+                FROM student_preferences sp
+                JOIN internship_companies ic ON sp.company_id = ic.id
+                WHERE sp.student_id IN ({placeholders})
+                GROUP BY sp.student_id
+            """, student_ids)
+            preferences = {row['student_id']: json.loads(row['preferences']) for row in cursor.fetchall()}
+            for student in students:
+                # JSON_ARRAYAGG 不保證順序，依志願序排列
+                student['preferences'] = sorted(preferences.get(student['student_id'], []), key=lambda p: p['order'])
+
+        return render_template('preferences/review_preferences.html',
+            students=students,
+            classes=classes,
+            selected_class=selected_class,
+            page=page,
+            total_pages=max((total + REVIEW_PAGE_SIZE - 1) // REVIEW_PAGE_SIZE, 1)
+        )
 
     except Exception as e:
         print("取得志願資料錯誤：", e)
@@ -160,4 +227,3 @@ def review_preferences():
     finally:
         cursor.close()
         conn.close()
-
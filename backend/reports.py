@@ -0,0 +1,155 @@
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
+from config import get_db
+from datetime import datetime
+import csv
+import io
+import os
+import tempfile
+import threading
+
+reports_bp = Blueprint("reports_bp", __name__)
+
+# 同時匯出的報表數上限，超過時回 429
+MAX_CONCURRENT_EXPORTS = 2
+FETCH_SIZE = 1000
+XLSX_CHUNK_SIZE = 64 * 1024
+
+_export_slots = threading.BoundedSemaphore(MAX_CONCURRENT_EXPORTS)
+
+# 每份報表：標題列、SQL（{class_filter} 會替換為班級條件）
+REPORTS = {
+    "users": {
+        "filename": "users",
+        "headers": ["ID", "帳號", "姓名", "Email", "角色", "班級", "科系", "建立時間"],
+        "sql": """
+            SELECT u.id, u.username, u.name, u.email, u.role, c.name, c.department,
+                   u.created_at
+            FROM users u
+            LEFT JOIN classes c ON u.class_id = c.id
+            WHERE u.deleted_at IS NULL {class_filter}
+            ORDER BY u.id
+        """,
+    },
+    "resume_status": {
+        "filename": "resume_status",
+        "headers": ["班級", "學號", "姓名", "履歷檔名", "版本", "狀態", "上傳時間"],
+        "sql": """
+            SELECT c.name, u.username, u.name, r.original_filename, r.version, COALESCE(r.status, 'missing'),
+                   r.created_at
+            FROM users u
+            JOIN classes c ON u.class_id = c.id
+            LEFT JOIN resumes r ON r.user_id = u.id AND r.is_latest = 1 AND r.deleted_at IS NULL
+            WHERE u.role = 'student' AND u.deleted_at IS NULL {class_filter}
+            ORDER BY c.id, u.username
+        """,
+    },
+    "preferences": {
+        "filename": "preferences",
+        "headers": ["班級", "學號", "姓名", "志願序", "公司", "填寫時間"],
+        "sql": """
+            SELECT c.name, u.username, u.name, sp.preference_order, ic.company_name,
+                   sp.submitted_at
+            FROM student_preferences sp
+            JOIN users u ON sp.student_id = u.id
+            JOIN classes c ON u.class_id = c.id
+            JOIN internship_companies ic ON sp.company_id = ic.id
+            WHERE u.deleted_at IS NULL {class_filter}
+            ORDER BY c.id, u.username, sp.preference_order
+        """,
+    },
+}
+
+
+def _format_row(row):
+    # 時間欄位在 Python 端格式化；SQL 帶參數時不能出現 DATE_FORMAT 的 %s
+    return tuple(v.strftime("%Y-%m-%d %H:%M:%S") if isinstance(v, datetime) else v for v in row)
+
+
+def _iter_rows(report, class_id):
+    """以非緩衝 cursor 分批取資料，記憶體用量與總筆數無關"""
+    sql = report["sql"].format(class_filter="AND u.class_id = %s" if class_id else "")
+    conn = get_db()
+    cursor = conn.cursor(buffered=False)
+    finished = False
+    try:
+        cursor.execute(sql, (class_id,) if class_id else ())
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield [_format_row(row) for row in rows]
+        finished = True
+    finally:
+        if finished:
+            cursor.close()
+            conn.close()
+        else:
+            # 用戶端中途斷線時結果尚未讀完，cursor.close() 會因 unread result 失敗；
+            # 直接關閉連線即可丟棄剩餘資料
+            conn.close()
+
+
+def _stream_csv(report, class_id):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # 讓 Excel 正確辨識 UTF-8
+    writer.writerow(report["headers"])
+    for rows in _iter_rows(report, class_id):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def _stream_xlsx(report, class_id):
+    from openpyxl import Workbook
+
+    # write_only 模式逐列寫入暫存檔，完成後再分段送出
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(report["filename"])
+    ws.append(report["headers"])
+    for rows in _iter_rows(report, class_id):
+        for row in rows:
+            ws.append(list(row))
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(XLSX_CHUNK_SIZE), b""):
+                yield chunk
+    finally:
+        os.remove(path)
+
+# -------------------------
+# API - 匯出報表 (CSV / XLSX)
+# -------------------------
+@reports_bp.route('/api/reports/<name>', methods=['GET'])
+def export_report(name):
+    if 'user_id' not in session or session.get('role') not in ("admin", "director"):
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    report = REPORTS.get(name)
+    fmt = request.args.get('format', 'csv')
+    class_id = request.args.get('class_id', type=int)
+    if not report or fmt not in ('csv', 'xlsx'):
+        return jsonify({"success": False, "message": "參數錯誤"}), 400
+
+    if not _export_slots.acquire(blocking=False):
+        return jsonify({"success": False, "message": "匯出作業繁忙，請稍後再試"}), 429
+
+    if fmt == 'csv':
+        body, mimetype = _stream_csv(report, class_id), "text/csv; charset=utf-8"
+    else:
+        body = _stream_xlsx(report, class_id)
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    filename = f"{report['filename']}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    # 串流結束（或連線中斷）時釋放名額
+    response.call_on_close(_export_slots.release)
+    return response
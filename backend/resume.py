@@ -1,6 +1,12 @@
-from flask import Blueprint, request, jsonify, session,send_file, render_template
+from flask import Blueprint, request, jsonify, session,send_file, render_template, current_app
 from werkzeug.utils import secure_filename
 from config import get_db
+from resume_search import schedule_extraction, get_resume_text
+from resume_thumbnail import file_sha256, schedule_thumbnail
+from upload_store import RESUME_FOLDER, enqueue_removal, schedule_compression, open_resume_stream
+from resume_archive import open_archived
+import resume_stats
+import difflib
 import os
 import traceback
 from datetime import datetime
@@ -8,8 +14,22 @@ from datetime import datetime
 resume_bp = Blueprint("resume_bp", __name__)
 
 # 上傳資料夾設定
-UPLOAD_FOLDER = "uploads/resumes"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_FOLDER = RESUME_FOLDER
+
+
+def _can_view_student(cursor, student_id):
+    """本人或該生班級的班導師（老師 / 主任）才可查看，與 get_class_resumes 相同規則"""
+    if session.get('user_id') == student_id:
+        return True
+    if session.get('role') not in ("teacher", "director"):
+        return False
+    cursor.execute("""
+        SELECT 1 FROM users u
+        JOIN classes_teacher ct ON ct.class_id = u.class_id
+        WHERE u.id = %s AND u.deleted_at IS NULL AND ct.teacher_id = %s AND ct.role = '班導師'
+        LIMIT 1
+    """, (student_id, session['user_id']))
+    return cursor.fetchone() is not None
 
 # -------------------------
 # API - 上傳履歷
@@ -22,6 +42,7 @@ def upload_resume_api():
 
         file = request.files['resume']
         username = request.form.get('username')
+        parent_resume_id = request.form.get('parent_resume_id', type=int)
 
         if not username:
             return jsonify({"success": False, "message": "缺少使用者帳號"}), 400
@@ -47,21 +68,67 @@ def upload_resume_api():
             return jsonify({"success": False, "message": "找不到使用者"}), 404
 
         user_id = user[0]
+        if parent_resume_id:
+            # 指定的上一版本必須是該生自己的履歷，不可接到別人的版本鏈
+            cursor.execute("SELECT user_id FROM resumes WHERE id = %s AND deleted_at IS NULL", (parent_resume_id,))
+            parent = cursor.fetchone()
+            if not parent or parent[0] != user_id:
+                cursor.close()
+                conn.close()
+                os.remove(save_path)
+                return jsonify({"success": False, "message": "指定的上一版本不屬於此學生"}), 400
+
         filesize = os.path.getsize(save_path)
+        content_hash = file_sha256(save_path)
+
+        # 版本鏈：預設接在學生最新的一份履歷之後，可指定 parent_resume_id
+        if parent_resume_id:
+            cursor.execute("""
+                SELECT id, COALESCE(parent_id, id), filepath FROM resumes
+                WHERE user_id = %s AND is_latest = 1 AND deleted_at IS NULL
+                  AND COALESCE(parent_id, id) = (SELECT COALESCE(parent_id, id) FROM resumes WHERE id = %s)
+                FOR UPDATE
+            """, (user_id, parent_resume_id))
+        else:
+            cursor.execute("""
+                SELECT id, COALESCE(parent_id, id), filepath FROM resumes
+                WHERE user_id = %s AND is_latest = 1 AND deleted_at IS NULL
+                ORDER BY created_at DESC
+                LIMIT 1
+                FOR UPDATE
+            """, (user_id,))
+        previous = cursor.fetchone()
+
+        root_id, version = None, 1
+        if previous:
+            prev_id, root_id, prev_filepath = previous
+            cursor.execute("SELECT MAX(version) FROM resumes WHERE id = %s OR parent_id = %s", (root_id, root_id))
+            version = (cursor.fetchone()[0] or 0) + 1
+            resume_stats.on_resume_removed(cursor, prev_id)
+            cursor.execute("UPDATE resumes SET is_latest = 0 WHERE id = %s", (prev_id,))
 
         cursor.execute("""
-            INSERT INTO resumes (user_id, original_filename, filepath, filesize, status, created_at)
-            VALUES (%s, %s, %s, %s, %s, NOW())
-        """, (user_id, original_filename, save_path, filesize, 'uploaded'))
+            INSERT INTO resumes (user_id, original_filename, filepath, filesize, content_hash, status,
+                                 parent_id, version, is_latest, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1, NOW())
+        """, (user_id, original_filename, save_path, filesize, content_hash, 'uploaded', root_id, version))
 
         resume_id = cursor.lastrowid
+        resume_stats.on_resume_added(cursor, resume_id)
         conn.commit()
         cursor.close()
         conn.close()
 
+        # 背景擷取履歷文字供全文搜尋
+        schedule_extraction(resume_id, save_path)
+        schedule_thumbnail(save_path, content_hash)
+        if previous:
+            schedule_compression(prev_id, prev_filepath)
+
         return jsonify({
             "success": True,
             "resume_id": resume_id,
+            "version": version,
             "filename": original_filename,
             "filesize": filesize,
             "status": "uploaded",
@@ -81,58 +148,192 @@ def download_resume(resume_id):
         conn = get_db()
         cursor = conn.cursor(dictionary=True)
 
-        cursor.execute("SELECT filepath, original_filename FROM resumes WHERE id = %s", (resume_id,))
+        cursor.execute("""
+            SELECT filepath, original_filename, archived FROM resumes
+            WHERE id = %s AND deleted_at IS NULL
+        """, (resume_id,))
         resume = cursor.fetchone()
         cursor.close()
         conn.close()
 
-        if not resume or not os.path.exists(resume['filepath']):
+        if not resume:
+            return jsonify({"success": False, "message": "找不到履歷檔案"}), 404
+
+        # 已封存的履歷從 pack 檔還原，直接傳送已開啟的檔案，避免還原快取淘汰後檔案消失
+        if resume['archived']:
+            stream = open_archived(resume_id)
+        elif os.path.exists(resume['filepath']):
+            stream = open_resume_stream(resume['filepath'])
+        else:
+            stream = None
+        if stream is None:
             return jsonify({"success": False, "message": "找不到履歷檔案"}), 404
 
-        return send_file(resume["filepath"], as_attachment=True, download_name=resume["original_filename"])
+        return send_file(stream, as_attachment=True,
+                         download_name=resume["original_filename"])
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "message": f"下載失敗: {str(e)}"}), 500
 
 # -------------------------
-# API - 查詢使用者履歷列表
+# API - 查詢目前登入學生的履歷列表
 # -------------------------
-@resume_bp.route('/api/list_resumes/<username>', methods=['GET'])
-def list_resumes(username):
+# 可選欄位（fields 參數），時間欄位取出後在 Python 端格式化
+RESUME_LIST_FIELDS = {
+    "id": "id",
+    "original_filename": "original_filename",
+    "status": "status",
+    "comment": "comment",
+    "note": "note",
+    "version": "version",
+    "filesize": "filesize",
+    "upload_time": "created_at AS upload_time",
+}
+
+@resume_bp.route('/api/resumes', methods=['GET'])
+def list_resumes():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未登入"}), 401
+
+    user_id = session['user_id']
+    requested = [f.strip() for f in (request.args.get('fields') or '').split(',') if f.strip()]
+    if any(f not in RESUME_LIST_FIELDS for f in requested):
+        return jsonify({"success": False, "message": "欄位參數錯誤"}), 400
+    columns = ', '.join(RESUME_LIST_FIELDS[f] for f in (requested or RESUME_LIST_FIELDS))
+
     try:
         conn = get_db()
         cursor = conn.cursor(dictionary=True)
 
-        cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-        user = cursor.fetchone()
-        if not user:
-            cursor.close()
-            conn.close()
-            return jsonify({"success": False, "message": "找不到使用者"}), 404
-
-        user_id = user["id"]
+        # 以筆數 + 最後更新時間作為弱 ETag，未變動時直接回 304
         cursor.execute("""
-            SELECT id, original_filename, status, comment, note, created_at
+            SELECT COUNT(*) AS total, UNIX_TIMESTAMP(MAX(updated_at)) AS last_updated
             FROM resumes
-            WHERE user_id = %s
-            ORDER BY created_at DESC
+            WHERE user_id = %s AND is_latest = 1 AND deleted_at IS NULL
         """, (user_id,))
-        resumes = cursor.fetchall()
+        stamp = cursor.fetchone()
+        etag = f"{user_id}-{stamp['total']}-{stamp['last_updated'] or 0}-{','.join(requested)}"
 
-        for r in resumes:
-            if isinstance(r.get('created_at'), datetime):
-                r['created_at'] = r['created_at'].strftime("%Y-%m-%d %H:%M:%S")
+        if request.if_none_match.contains_weak(etag):
+            cursor.close()
+            conn.close()
+            response = current_app.response_class(status=304)
+        else:
+            cursor.execute(f"""
+                SELECT {columns}
+                FROM resumes
+                WHERE user_id = %s AND is_latest = 1 AND deleted_at IS NULL
+                ORDER BY created_at DESC
+            """, (user_id,))
+            resumes = cursor.fetchall()
+            cursor.close()
+            conn.close()
+            for r in resumes:
+                if r.get('upload_time'):
+                    r['upload_time'] = r['upload_time'].strftime("%Y-%m-%d %H:%M:%S")
+            response = jsonify({"success": True, "resumes": resumes})
+
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"查詢失敗: {str(e)}"}), 500
+
+# -------------------------
+# API - 履歷版本列表
+# -------------------------
+@resume_bp.route('/api/resume_versions/<int:resume_id>', methods=['GET'])
+def resume_versions(resume_id):
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未授權"}), 403
 
+    try:
+        conn = get_db()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT user_id FROM resumes WHERE id = %s AND deleted_at IS NULL", (resume_id,))
+        owner = cursor.fetchone()
+        if not owner:
+            cursor.close()
+            conn.close()
+            return jsonify({"success": False, "message": "找不到該履歷"}), 404
+        if not _can_view_student(cursor, owner['user_id']):
+            cursor.close()
+            conn.close()
+            return jsonify({"success": False, "message": "無權限查看此履歷"}), 403
+
+        cursor.execute("""
+            SELECT v.id, v.version, v.original_filename, v.status, v.is_latest, v.filesize, v.created_at
+            FROM resumes r
+            JOIN resumes v ON COALESCE(v.parent_id, v.id) = COALESCE(r.parent_id, r.id)
+            WHERE r.id = %s AND v.deleted_at IS NULL
+            ORDER BY v.version DESC
+        """, (resume_id,))
+        versions = cursor.fetchall()
         cursor.close()
         conn.close()
 
-        return jsonify({"success": True, "resumes": resumes})
+        if not versions:
+            return jsonify({"success": False, "message": "找不到該履歷"}), 404
+
+        for v in versions:
+            v['is_latest'] = bool(v['is_latest'])
+            if isinstance(v.get('created_at'), datetime):
+                v['created_at'] = v['created_at'].strftime("%Y-%m-%d %H:%M:%S")
+
+        return jsonify({"success": True, "versions": versions})
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "message": f"查詢失敗: {str(e)}"}), 500
 
+# -------------------------
+# API - 比較兩個履歷版本（以擷取文字計算差異）
+# -------------------------
+@resume_bp.route('/api/resume_diff', methods=['GET'])
+def resume_diff():
+    from_id = request.args.get('from', type=int)
+    to_id = request.args.get('to', type=int)
+    if not from_id or not to_id:
+        return jsonify({"success": False, "message": "缺少 from / to"}), 400
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未授權"}), 403
+
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(DISTINCT COALESCE(parent_id, id)), COUNT(*), MIN(user_id)
+            FROM resumes WHERE id IN (%s, %s)
+        """, (from_id, to_id))
+        chains, found, owner_id = cursor.fetchone()
+        allowed = found == len({from_id, to_id}) and _can_view_student(cursor, owner_id)
+        cursor.close()
+        conn.close()
+
+        if found != len({from_id, to_id}):
+            return jsonify({"success": False, "message": "找不到該履歷"}), 404
+        if chains != 1:
+            return jsonify({"success": False, "message": "兩份履歷不屬於同一版本鏈"}), 400
+        if not allowed:
+            return jsonify({"success": False, "message": "無權限查看此履歷"}), 403
+
+        old_text, new_text = get_resume_text(from_id), get_resume_text(to_id)
+        if old_text is None or new_text is None:
+            return jsonify({"success": False, "message": "履歷文字尚未擷取完成"}), 409
+
+        diff = list(difflib.unified_diff(
+            old_text.splitlines(), new_text.splitlines(),
+            fromfile=f"v{from_id}", tofile=f"v{to_id}", lineterm=""
+        ))
+        return jsonify({"success": True, "diff": diff})
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"伺服器錯誤: {str(e)}"}), 500
+
 # -------------------------
 # API - 審核履歷 (僅限班導師 / 主任)
 # -------------------------
@@ -163,6 +364,7 @@ def review_resume():
             conn.close()
             return jsonify({"success": False, "message": "找不到該履歷"}), 404
 
+        resume_stats.on_status_change(cursor, resume_id, status)
         if comment:
             cursor.execute(
                 "UPDATE resumes SET status = %s, comment = %s WHERE id = %s",
@@ -248,40 +450,6 @@ def resume_status():
         traceback.print_exc()
         return jsonify({"success": False, "message": f"伺服器錯誤: {str(e)}"}), 500
 
-# -------------------------
-# API - 查詢所有學生履歷
-# -------------------------
-@resume_bp.route('/api/get_student_resumes', methods=['GET'])
-def get_student_resumes():
-    try:
-        username = request.args.get('username')
-        if not username:
-            return jsonify({"success": False, "message": "缺少 username"}), 400
-
-        conn = get_db()
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute("""
-            SELECT r.id, r.original_filename, r.status, r.comment, r.note, r.created_at AS upload_time
-            FROM resumes r
-            JOIN users u ON r.user_id = u.id
-            WHERE u.username = %s
-            ORDER BY r.created_at DESC
-        """, (username,))
-        resumes = cursor.fetchall()
-
-        for r in resumes:
-            if isinstance(r.get('upload_time'), datetime):
-                r['upload_time'] = r['upload_time'].strftime("%Y-%m-%d %H:%M:%S")
-
-        cursor.close()
-        conn.close()
-        return jsonify({"success": True, "resumes": resumes})
-    
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"success": False, "message": f"伺服器錯誤: {str(e)}"}), 500
-
 # -------------------------
 # API - 取得班導 / 主任 履歷 (支援多班級 & 全系)
 # -------------------------
@@ -321,6 +489,7 @@ def get_class_resumes():
                     r.original_filename AS original_filename,
                     r.filepath,
                     r.status,
+                    r.version,
                     r.created_at AS submitted_at,
                     u.id AS student_id,
                     u.username,
@@ -331,7 +500,8 @@ def get_class_resumes():
                 FROM resumes r
                 JOIN users u ON r.user_id = u.id
                 JOIN classes c ON u.class_id = c.id
-                WHERE u.class_id IN ({format_strings})
+                WHERE u.class_id IN ({format_strings}) AND u.deleted_at IS NULL
+                  AND r.is_latest = 1 AND r.deleted_at IS NULL
                 ORDER BY r.created_at DESC
             """
             cursor.execute(query, class_ids)
@@ -366,22 +536,39 @@ def delete_resume():
     try:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute("SELECT filepath FROM resumes WHERE id = %s", (resume_id,))
+        cursor.execute("""
+            SELECT filepath, COALESCE(parent_id, id), is_latest FROM resumes
+            WHERE id = %s AND deleted_at IS NULL
+        """, (resume_id,))
         result = cursor.fetchone()
         if not result:
             cursor.close()
             conn.close()
             return jsonify({"success": False, "message": "找不到該履歷"}), 404
 
-        filepath = result[0]
-        if os.path.exists(filepath):
-            os.remove(filepath)
-
-        cursor.execute("DELETE FROM resumes WHERE id = %s", (resume_id,))
+        # 先標記刪除，實體檔案與資料列交由背景 GC 回收
+        resume_stats.on_resume_removed(cursor, resume_id)
+        cursor.execute("UPDATE resumes SET deleted_at = NOW(), is_latest = 0 WHERE id = %s", (resume_id,))
+
+        # 刪除的是最新版本時，改由前一個版本成為最新版本
+        root_id, was_latest = result[1], result[2]
+        if was_latest:
+            cursor.execute("""
+                SELECT id FROM resumes
+                WHERE (id = %s OR parent_id = %s) AND deleted_at IS NULL
+                ORDER BY version DESC
+                LIMIT 1
+            """, (root_id, root_id))
+            promoted = cursor.fetchone()
+            if promoted:
+                cursor.execute("UPDATE resumes SET is_latest = 1 WHERE id = %s", (promoted[0],))
+                resume_stats.on_resume_added(cursor, promoted[0])
         conn.commit()
         cursor.close()
         conn.close()
 
+        enqueue_removal([(int(resume_id), result[0])])
+
         return jsonify({"success": True, "message": "履歷已刪除"})
 
     except Exception as e:
@@ -407,6 +594,7 @@ def approve_resume():
             conn.close()
             return jsonify({"success": False, "message": "找不到該履歷"}), 404
 
+        resume_stats.on_status_change(cursor, resume_id, "approved")
         cursor.execute("UPDATE resumes SET status = %s WHERE id = %s", ("approved", resume_id))
         conn.commit()
         cursor.close()
@@ -436,6 +624,7 @@ def reject_resume():
             conn.close()
             return jsonify({"success": False, "message": "找不到該履歷"}), 404
 
+        resume_stats.on_status_change(cursor, resume_id, "rejected")
         cursor.execute("UPDATE resumes SET status = 'rejected' WHERE id = %s", (resume_id,))
         conn.commit()
         cursor.close()
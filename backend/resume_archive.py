@@ -0,0 +1,193 @@
+from config import get_db
+from upload_store import read_resume_bytes
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import os
+import threading
+import traceback
+import zlib
+
+# 封存資料夾：多份履歷壓縮後依序寫入同一個 pack 檔，以 resume_archive 索引定位
+ARCHIVE_FOLDER = "uploads/archive"
+RESTORE_FOLDER = os.path.join(ARCHIVE_FOLDER, "restored")
+os.makedirs(RESTORE_FOLDER, exist_ok=True)
+
+# 預設封存一年半以前上傳的履歷（約已畢業的學年）
+ARCHIVE_AGE_DAYS = 540
+ARCHIVE_BATCH_SIZE = 200
+RESTORE_CACHE_SIZE = 32
+
+_archive_lock = threading.Lock()
+_last_report = None
+
+# -------------------------
+# 封存
+# -------------------------
+def _read_source(filepath):
+    """讀取履歷原檔，回傳 (內容, 檔案大小)；背景壓縮可能剛把原檔換成 .gz，找不到時改讀壓縮檔"""
+    for path in (filepath, filepath + ".gz"):
+        try:
+            return read_resume_bytes(path), os.path.getsize(path)
+        except FileNotFoundError:
+            continue
+    return None, 0
+
+
+def _remove_source(filepath):
+    """移除已封存的原檔與背景壓縮產生的 .gz（兩者任一可能已不存在）"""
+    for path in (filepath, filepath + ".gz"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def archive_resumes(before=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """將 before 之前上傳的履歷寫入 pack 檔並移除原檔，回傳節省空間報告"""
+    global _last_report
+    if not _archive_lock.acquire(blocking=False):
+        return None
+
+    before = before or datetime.now() - timedelta(days=ARCHIVE_AGE_DAYS)
+    pack_path = os.path.join(ARCHIVE_FOLDER, f"pack_{datetime.now().strftime('%Y%m%d%H%M%S')}.pack")
+    report = {
+        "before": before.strftime("%Y-%m-%d"),
+        "pack_file": pack_path,
+        "archived": 0,
+        "bytes_before": 0,
+        "bytes_after": 0,
+    }
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        last_id = 0
+        with open(pack_path, "ab") as pack:
+            while True:
+                cursor.execute("""
+                    SELECT id, filepath FROM resumes
+                    WHERE id > %s AND created_at < %s AND archived = 0 AND deleted_at IS NULL
+                    ORDER BY id
+                    LIMIT %s
+                """, (last_id, before, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                entries, archived_files = [], []
+                for resume_id, filepath in rows:
+                    data, size = _read_source(filepath)
+                    if data is None:
+                        continue
+                    blob = zlib.compress(data, 9)
+                    offset = pack.tell()
+                    pack.write(blob)
+                    entries.append((resume_id, pack_path, offset, len(blob), len(data)))
+                    archived_files.append(filepath)
+                    report["bytes_before"] += size
+                    report["bytes_after"] += len(blob)
+                if not entries:
+                    continue
+
+                # 確定寫入磁碟後才更新資料庫並刪除原檔
+                pack.flush()
+                os.fsync(pack.fileno())
+                cursor.executemany("""
+                    INSERT INTO resume_archive (resume_id, pack_file, offset, length, original_size, archived_at)
+                    VALUES (%s, %s, %s, %s, %s, NOW())
+                """, entries)
+                ids = [e[0] for e in entries]
+                placeholders = ','.join(['%s'] * len(ids))
+                cursor.execute(f"UPDATE resumes SET archived = 1 WHERE id IN ({placeholders})", ids)
+                conn.commit()
+
+                for filepath in archived_files:
+                    _remove_source(filepath)
+                report["archived"] += len(entries)
+
+        if report["archived"] == 0:
+            os.remove(pack_path)
+            report["pack_file"] = None
+        report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+        _last_report = report
+        return report
+    except Exception:
+        conn.rollback()
+        traceback.print_exc()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+        _archive_lock.release()
+
+
+def start_archive(before=None):
+    if _archive_lock.locked():
+        return False
+    threading.Thread(target=archive_resumes, kwargs={"before": before},
+                     name="resume-archive", daemon=True).start()
+    return True
+
+
+def last_archive_report():
+    return _last_report
+
+# -------------------------
+# 還原（下載時即時解壓，保留最近使用的檔案）
+# -------------------------
+_restored = OrderedDict()
+_restore_lock = threading.Lock()
+
+
+def open_archived(resume_id):
+    """
+    回傳解壓後暫存檔的已開啟檔案物件，找不到封存資料時回傳 None。
+    在 _restore_lock 內開檔，之後即使被快取淘汰刪除，已開啟的檔案仍可讀完。
+    """
+    with _restore_lock:
+        path = _restored.get(resume_id)
+        if path and os.path.exists(path):
+            _restored.move_to_end(resume_id)
+            return open(path, "rb")
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pack_file, offset, length FROM resume_archive WHERE resume_id = %s", (resume_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+    if not row:
+        return None
+
+    pack_file, offset, length = row
+    with open(pack_file, "rb") as pack:
+        pack.seek(offset)
+        data = zlib.decompress(pack.read(length))
+
+    path = os.path.join(RESTORE_FOLDER, str(resume_id))
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+    with _restore_lock:
+        f = open(path, "rb")
+        _restored[resume_id] = path
+        _restored.move_to_end(resume_id)
+        while len(_restored) > RESTORE_CACHE_SIZE:
+            _, evicted = _restored.popitem(last=False)
+            try:
+                os.remove(evicted)
+            except OSError:
+                pass
+    return f
+
+
+if __name__ == "__main__":
+    import sys
+    cutoff = datetime.strptime(sys.argv[1], "%Y-%m-%d") if len(sys.argv) > 1 else None
+    result = archive_resumes(cutoff)
+    print(f"封存 {result['archived']} 份履歷，節省 {result['bytes_reclaimed']} bytes")
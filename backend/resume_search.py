@@ -0,0 +1,186 @@
+from flask import Blueprint, request, jsonify, session
+from concurrent.futures import ThreadPoolExecutor
+from config import get_db
+import os
+import re
+import zipfile
+import traceback
+
+resume_search_bp = Blueprint("resume_search_bp", __name__)
+
+# 背景擷取用的 worker pool（不佔用請求執行緒）
+_extract_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="resume-extract")
+
+# 擷取後處理（例如相似度比對），由其他模組註冊
+_after_extract_hooks = []
+
+SNIPPET_RADIUS = 60
+MAX_SEARCH_LIMIT = 100
+
+# -------------------------
+# 文字擷取
+# -------------------------
+def _extract_pdf(filepath):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+    reader = PdfReader(filepath)
+    return "\n".join((page.extract_text() or "") for page in reader.pages)
+
+
+def _extract_docx(filepath):
+    # docx 為 zip 包，直接讀取 word/document.xml，不需額外套件
+    with zipfile.ZipFile(filepath) as zf:
+        xml = zf.read("word/document.xml").decode("utf-8", errors="ignore")
+    xml = re.sub(r"</w:p>", "\n", xml)
+    return re.sub(r"<[^>]+>", "", xml)
+
+
+def extract_text(filepath):
+    """依副檔名擷取文字，不支援的格式回傳 None"""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == ".pdf":
+        return _extract_pdf(filepath)
+    if ext == ".docx":
+        return _extract_docx(filepath)
+    return None
+
+
+def register_after_extract(hook):
+    """註冊擷取完成後的回呼：hook(resume_id, text)"""
+    _after_extract_hooks.append(hook)
+
+
+def _run_extraction(resume_id, filepath):
+    status = "done"
+    try:
+        text = extract_text(filepath)
+        if text is None:
+            status = "unsupported"
+        else:
+            text = re.sub(r"[ \t\r\f\v]+", " ", text).strip()
+    except Exception:
+        traceback.print_exc()
+        text, status = None, "failed"
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO resume_texts (resume_id, content, status, extracted_at)
+            VALUES (%s, %s, %s, NOW())
+            ON DUPLICATE KEY UPDATE content = VALUES(content), status = VALUES(status),
+                                    extracted_at = VALUES(extracted_at)
+        """, (resume_id, text, status))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    if text:
+        for hook in _after_extract_hooks:
+            try:
+                hook(resume_id, text)
+            except Exception:
+                traceback.print_exc()
+
+
+def schedule_extraction(resume_id, filepath):
+    """上傳後呼叫，將擷取工作丟到背景執行"""
+    _extract_pool.submit(_run_extraction, resume_id, filepath)
+
+
+def get_resume_text(resume_id):
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT content FROM resume_texts WHERE resume_id = %s AND status = 'done'",
+                       (resume_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def reindex_missing():
+    """補建尚未擷取過的履歷（部署後或資料修復時執行）"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT r.id, r.filepath
+        FROM resumes r
+        LEFT JOIN resume_texts t ON t.resume_id = r.id
+        WHERE t.resume_id IS NULL
+    """)
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    for resume_id, filepath in rows:
+        _run_extraction(resume_id, filepath)
+    return len(rows)
+
+# -------------------------
+# API - 履歷內容全文搜尋
+# -------------------------
+@resume_search_bp.route('/api/search_resume_content', methods=['GET'])
+def search_resume_content():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未授權"}), 403
+    if session.get('role') not in ("teacher", "director", "admin"):
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    keyword = (request.args.get('q') or '').strip()
+    class_id = request.args.get('class_id', type=int)
+    limit = min(request.args.get('limit', 20, type=int), MAX_SEARCH_LIMIT)
+
+    if not keyword:
+        return jsonify({"success": False, "message": "缺少搜尋關鍵字"}), 400
+
+    # 以片語模式比對，避免使用者輸入的運算子影響查詢
+    phrase = '"' + keyword.replace('"', ' ') + '"'
+
+    conditions = ["MATCH(t.content) AGAINST (%s IN BOOLEAN MODE)"]
+    params = [keyword, SNIPPET_RADIUS, SNIPPET_RADIUS * 2 + len(keyword), phrase, phrase]
+    if class_id:
+        conditions.append("u.class_id = %s")
+        params.append(class_id)
+    params.append(limit)
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"""
+            SELECT
+                r.id AS resume_id,
+                r.original_filename,
+                u.id AS student_id,
+                u.username,
+                u.name,
+                u.class_id,
+                SUBSTRING(t.content, GREATEST(LOCATE(%s, t.content) - %s, 1), %s) AS snippet,
+                MATCH(t.content) AGAINST (%s IN BOOLEAN MODE) AS score
+            FROM resume_texts t
+            JOIN resumes r ON r.id = t.resume_id
+            JOIN users u ON u.id = r.user_id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY score DESC
+            LIMIT %s
+        """, params)
+        hits = cursor.fetchall()
+        for h in hits:
+            h['score'] = float(h['score'])
+        return jsonify({"success": True, "hits": hits})
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    print(f"已補建 {reindex_missing()} 份履歷文字")
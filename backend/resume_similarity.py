@@ -0,0 +1,203 @@
+from flask import Blueprint, request, jsonify, session
+from config import get_db
+from resume_search import register_after_extract
+import hashlib
+import random
+import re
+import struct
+import traceback
+
+resume_similarity_bp = Blueprint("resume_similarity_bp", __name__)
+
+# MinHash 參數：128 個雜湊，切成 32 個 band × 4 列
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+SIMILARITY_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20250909)  # 固定種子，簽章才能跨程序比較
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(NUM_PERM)]
+_SIGNATURE_FORMAT = f"<{NUM_PERM}Q"
+
+# -------------------------
+# MinHash / LSH
+# -------------------------
+def _shingles(text):
+    # 以字元 n-gram 切片，中英文皆適用
+    text = re.sub(r"\s+", "", text.lower())
+    if len(text) < SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash_signature(text):
+    hashes = [_hash64(s) for s in _shingles(text)]
+    if not hashes:
+        return None
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(signature):
+    """每個 band 的雜湊值，相同 band 值的履歷落在同一個 bucket"""
+    keys = []
+    for band in range(BANDS):
+        chunk = struct.pack(f"<{ROWS}Q", *signature[band * ROWS:(band + 1) * ROWS])
+        bucket = int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little", signed=True)
+        keys.append((band, bucket))
+    return keys
+
+
+def estimate_similarity(sig_a, sig_b):
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def index_resume(resume_id, text):
+    """擷取完成後呼叫：找出候選相似履歷並寫入索引"""
+    signature = minhash_signature(text)
+    if signature is None:
+        return
+    keys = band_keys(signature)
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT user_id FROM resumes WHERE id = %s", (resume_id,))
+        row = cursor.fetchone()
+        if not row:
+            return
+        user_id = row[0]
+
+        # 只比對與自己至少有一個 band 相同的候選，不需掃描全部履歷
+        placeholders = ','.join(['(%s, %s)'] * len(keys))
+        params = [v for key in keys for v in key]
+        cursor.execute(f"""
+            SELECT DISTINCT m.resume_id, m.signature
+            FROM resume_lsh_buckets b
+            JOIN resume_minhash m ON m.resume_id = b.resume_id
+            JOIN resumes r ON r.id = b.resume_id
+            WHERE (b.band, b.bucket) IN ({placeholders})
+              AND b.resume_id != %s
+              AND r.user_id != %s
+              AND r.deleted_at IS NULL
+        """, params + [resume_id, user_id])
+        candidates = cursor.fetchall()
+
+        pairs = []
+        for other_id, other_blob in candidates:
+            similarity = estimate_similarity(signature, struct.unpack(_SIGNATURE_FORMAT, other_blob))
+            if similarity >= SIMILARITY_THRESHOLD:
+                pairs.append((min(resume_id, other_id), max(resume_id, other_id), similarity))
+
+        cursor.execute("""
+            REPLACE INTO resume_minhash (resume_id, signature) VALUES (%s, %s)
+        """, (resume_id, struct.pack(_SIGNATURE_FORMAT, *signature)))
+        cursor.execute("DELETE FROM resume_lsh_buckets WHERE resume_id = %s", (resume_id,))
+        cursor.executemany("""
+            INSERT INTO resume_lsh_buckets (band, bucket, resume_id) VALUES (%s, %s, %s)
+        """, [(band, bucket, resume_id) for band, bucket in keys])
+        if pairs:
+            cursor.executemany("""
+                REPLACE INTO resume_similar_pairs (resume_a, resume_b, similarity, detected_at)
+                VALUES (%s, %s, %s, NOW())
+            """, pairs)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+register_after_extract(index_resume)
+
+
+def rebuild_index():
+    """由已擷取的文字重建全部簽章（部署後補建用）"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT resume_id FROM resume_texts WHERE status = 'done' ORDER BY resume_id")
+    resume_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+
+    for resume_id in resume_ids:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("SELECT content FROM resume_texts WHERE resume_id = %s", (resume_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        if row and row[0]:
+            try:
+                index_resume(resume_id, row[0])
+            except Exception:
+                traceback.print_exc()
+    return len(resume_ids)
+
+# -------------------------
+# API - 班級相似履歷報表
+# -------------------------
+@resume_similarity_bp.route('/api/class_similar_resumes', methods=['GET'])
+def class_similar_resumes():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未授權"}), 403
+    if session.get('role') not in ("teacher", "director"):
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    user_id = session['user_id']
+    class_id = request.args.get('class_id', type=int)
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # 與 get_class_resumes 相同：只看自己擔任班導師的班級
+        cursor.execute("""
+            SELECT class_id FROM classes_teacher
+            WHERE teacher_id = %s AND role = '班導師'
+        """, (user_id,))
+        class_ids = [row['class_id'] for row in cursor.fetchall()]
+        if class_id:
+            if class_id not in class_ids:
+                return jsonify({"success": False, "message": "無權查看此班級"}), 403
+            class_ids = [class_id]
+        if not class_ids:
+            return jsonify({"success": True, "pairs": []})
+
+        format_strings = ','.join(['%s'] * len(class_ids))
+        cursor.execute(f"""
+            SELECT
+                p.similarity,
+                ra.id AS resume_id, ua.id AS student_id, ua.username, ua.name, ua.class_id,
+                rb.id AS similar_resume_id, ub.id AS similar_student_id, ub.username AS similar_username,
+                ub.name AS similar_name, ub.class_id AS similar_class_id
+            FROM resume_similar_pairs p
+            JOIN resumes ra ON ra.id = p.resume_a
+            JOIN resumes rb ON rb.id = p.resume_b
+            JOIN users ua ON ua.id = ra.user_id
+            JOIN users ub ON ub.id = rb.user_id
+            WHERE (ua.class_id IN ({format_strings}) OR ub.class_id IN ({format_strings}))
+              AND ra.deleted_at IS NULL AND rb.deleted_at IS NULL
+              AND ra.is_latest = 1 AND rb.is_latest = 1
+            ORDER BY p.similarity DESC
+        """, class_ids + class_ids)
+        pairs = cursor.fetchall()
+        for p in pairs:
+            p['similarity'] = round(float(p['similarity']), 3)
+
+        return jsonify({"success": True, "pairs": pairs})
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    print(f"已重建 {rebuild_index()} 份履歷簽章")
@@ -0,0 +1,172 @@
+from flask import Blueprint, jsonify, session
+from config import get_db
+import dashboard
+import traceback
+
+resume_stats_bp = Blueprint("resume_stats_bp", __name__)
+
+# 依 (班級, 狀態) 統計每位學生「最新且未刪除」的履歷數量，
+# 由 resume.py 的上傳 / 審核 / 刪除流程在同一個交易中更新。
+# 以下函式皆接收呼叫端的 tuple cursor，不自行 commit。
+
+def _bump_class(cursor, class_id, status, delta):
+    if class_id is None or not status:
+        return
+    cursor.execute("""
+        INSERT INTO class_resume_stats (class_id, status, total)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+    """, (class_id, status, delta))
+
+
+def _bump(cursor, class_id, status, delta):
+    # 管理員首頁的全系統狀態統計一併更新
+    dashboard.bump(cursor, "resumes_by_status", status, delta)
+    _bump_class(cursor, class_id, status, delta)
+
+
+def _counted_row(cursor, resume_id):
+    """回傳 (class_id, status)，若該履歷不在統計範圍內則回傳 None"""
+    cursor.execute("""
+        SELECT u.class_id, r.status
+        FROM resumes r
+        JOIN users u ON u.id = r.user_id
+        WHERE r.id = %s AND r.is_latest = 1 AND r.deleted_at IS NULL
+        FOR UPDATE
+    """, (resume_id,))
+    return cursor.fetchone()
+
+
+def on_resume_added(cursor, resume_id):
+    """履歷成為最新版本後呼叫（新上傳、刪除後遞補）"""
+    row = _counted_row(cursor, resume_id)
+    if row:
+        _bump(cursor, row[0], row[1], 1)
+
+
+def on_resume_removed(cursor, resume_id):
+    """履歷即將不再是最新版本或被刪除前呼叫"""
+    row = _counted_row(cursor, resume_id)
+    if row:
+        _bump(cursor, row[0], row[1], -1)
+
+
+def on_status_change(cursor, resume_id, new_status):
+    """更新 resumes.status 之前呼叫"""
+    row = _counted_row(cursor, resume_id)
+    if row and row[1] != new_status:
+        _bump(cursor, row[0], row[1], -1)
+        _bump(cursor, row[0], new_status, 1)
+
+
+def on_class_change(cursor, user_id, old_class, new_class):
+    """學生換班時呼叫（users 列須已鎖定），將其最新履歷的統計由舊班級移到新班級"""
+    if old_class == new_class:
+        return
+    cursor.execute("""
+        SELECT status, COUNT(*) FROM resumes
+        WHERE user_id = %s AND is_latest = 1 AND deleted_at IS NULL
+        GROUP BY status
+    """, (user_id,))
+    for status, total in cursor.fetchall():
+        _bump_class(cursor, old_class, status, -total)
+        _bump_class(cursor, new_class, status, total)
+
+
+def on_user_removed(cursor, user_id):
+    """刪除使用者（連同履歷）前呼叫"""
+    cursor.execute("""
+        SELECT u.class_id, r.status, COUNT(*)
+        FROM resumes r
+        JOIN users u ON u.id = r.user_id
+        WHERE r.user_id = %s AND r.is_latest = 1 AND r.deleted_at IS NULL
+        GROUP BY u.class_id, r.status
+    """, (user_id,))
+    for class_id, status, total in cursor.fetchall():
+        _bump(cursor, class_id, status, -total)
+
+
+def rebuild():
+    """由 resumes 全量重建統計表，用於修正偏差"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM class_resume_stats")
+        cursor.execute("""
+            INSERT INTO class_resume_stats (class_id, status, total)
+            SELECT u.class_id, r.status, COUNT(*)
+            FROM resumes r
+            JOIN users u ON u.id = r.user_id
+            WHERE u.class_id IS NOT NULL AND r.is_latest = 1 AND r.deleted_at IS NULL
+            GROUP BY u.class_id, r.status
+        """)
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+        conn.close()
+
+# -------------------------
+# API - 班級履歷狀態統計（首頁儀表板）
+# -------------------------
+@resume_stats_bp.route('/api/class_resume_stats', methods=['GET'])
+def class_resume_stats():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未授權"}), 403
+
+    role = session.get('role')
+    if role not in ("teacher", "director"):
+        return jsonify({"success": False, "message": "角色無權限"}), 403
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # 主任看全系，老師看自己擔任班導師的班級
+        if role == "director":
+            cursor.execute("SELECT id, name, department FROM classes")
+        else:
+            cursor.execute("""
+                SELECT c.id, c.name, c.department
+                FROM classes c
+                JOIN classes_teacher ct ON ct.class_id = c.id
+                WHERE ct.teacher_id = %s AND ct.role = '班導師'
+            """, (session['user_id'],))
+        classes = {c['id']: dict(c, uploaded=0, approved=0, rejected=0, submitted=0, enrolled=0)
+                   for c in cursor.fetchall()}
+        if not classes:
+            return jsonify({"success": True, "classes": []})
+
+        class_ids = list(classes)
+        format_strings = ','.join(['%s'] * len(class_ids))
+        cursor.execute(f"""
+            SELECT class_id, status, total FROM class_resume_stats
+            WHERE class_id IN ({format_strings})
+        """, class_ids)
+        for row in cursor.fetchall():
+            stats = classes[row['class_id']]
+            stats[row['status']] = stats.get(row['status'], 0) + row['total']
+            stats['submitted'] += row['total']
+
+        cursor.execute(f"""
+            SELECT class_id, COUNT(*) AS enrolled FROM users
+            WHERE role = 'student' AND deleted_at IS NULL AND class_id IN ({format_strings})
+            GROUP BY class_id
+        """, class_ids)
+        for row in cursor.fetchall():
+            classes[row['class_id']]['enrolled'] = row['enrolled']
+
+        for stats in classes.values():
+            stats['missing'] = max(stats['enrolled'] - stats['submitted'], 0)
+
+        return jsonify({"success": True, "classes": list(classes.values())})
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    print(f"已重建 {rebuild()} 筆班級履歷統計")
@@ -0,0 +1,125 @@
+from flask import Blueprint, jsonify, send_file
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from config import get_db
+import hashlib
+import os
+import threading
+import traceback
+
+resume_thumbnail_bp = Blueprint("resume_thumbnail_bp", __name__)
+
+# 縮圖快取資料夾（以內容雜湊命名，內容不變則網址不變）
+THUMBNAIL_FOLDER = "uploads/thumbnails"
+os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
+
+THUMBNAIL_WIDTH = 240
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+LAZY_RENDER_TIMEOUT = 10
+
+# 背景與即時產生共用同一個有限大小的 pool，大量上傳時不會吃滿 CPU
+_render_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="resume-thumb")
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def file_sha256(filepath):
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def thumbnail_path(content_hash):
+    return os.path.join(THUMBNAIL_FOLDER, f"{content_hash}.png")
+
+
+def _render(filepath, content_hash):
+    """將 PDF 第一頁轉成 PNG 縮圖，無法產生時回傳 None"""
+    target = thumbnail_path(content_hash)
+    if os.path.exists(target):
+        return target
+    if os.path.splitext(filepath)[1].lower() != ".pdf":
+        return None
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        return None
+
+    with fitz.open(filepath) as doc:
+        if doc.page_count == 0:
+            return None
+        page = doc[0]
+        zoom = THUMBNAIL_WIDTH / page.rect.width
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        # 先寫暫存檔再改名，避免讀到寫到一半的縮圖
+        tmp = f"{target}.{threading.get_ident()}.tmp"
+        pix.save(tmp)
+        os.replace(tmp, target)
+    return target
+
+
+def _submit(filepath, content_hash):
+    # 同一份內容同時只會排一個工作
+    with _inflight_lock:
+        future = _inflight.get(content_hash)
+        if future is not None:
+            return future
+        future = _render_pool.submit(_render, filepath, content_hash)
+        _inflight[content_hash] = future
+    # 工作若已完成，callback 會在目前執行緒立即執行，必須在釋放鎖之後才註冊
+    future.add_done_callback(lambda done: _forget(content_hash, done))
+    return future
+
+
+def _forget(content_hash, future):
+    with _inflight_lock:
+        if _inflight.get(content_hash) is future:
+            del _inflight[content_hash]
+
+
+def schedule_thumbnail(filepath, content_hash):
+    """上傳後呼叫，於背景預先產生縮圖"""
+    if not os.path.exists(thumbnail_path(content_hash)):
+        _submit(filepath, content_hash)
+
+# -------------------------
+# API - 履歷縮圖
+# -------------------------
+@resume_thumbnail_bp.route('/api/resume_thumbnail/<int:resume_id>', methods=['GET'])
+def resume_thumbnail(resume_id):
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT filepath, content_hash FROM resumes WHERE id = %s", (resume_id,))
+        resume = cursor.fetchone()
+        if not resume or not os.path.exists(resume['filepath']):
+            return jsonify({"success": False, "message": "找不到履歷檔案"}), 404
+
+        content_hash = resume['content_hash']
+        if not content_hash:
+            # 舊資料沒有雜湊，補算後寫回
+            content_hash = file_sha256(resume['filepath'])
+            cursor.execute("UPDATE resumes SET content_hash = %s WHERE id = %s", (content_hash, resume_id))
+            conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    target = thumbnail_path(content_hash)
+    if not os.path.exists(target):
+        # 背景工作尚未完成時，改為即時產生（仍受 pool 大小限制）
+        try:
+            target = _submit(resume['filepath'], content_hash).result(timeout=LAZY_RENDER_TIMEOUT)
+        except FutureTimeout:
+            return jsonify({"success": False, "message": "縮圖產生中，請稍後再試"}), 503
+        except Exception:
+            traceback.print_exc()
+            target = None
+        if not target:
+            return jsonify({"success": False, "message": "此檔案格式無法產生縮圖"}), 404
+
+    response = send_file(target, mimetype="image/png", etag=content_hash,
+                         max_age=THUMBNAIL_MAX_AGE, conditional=True)
+    response.headers["Cache-Control"] = f"public, max-age={THUMBNAIL_MAX_AGE}, immutable"
+    return response
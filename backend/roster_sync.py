@@ -0,0 +1,167 @@
+from config import get_db
+from user_import import iter_roster
+import resume_stats
+import dashboard
+import company_demand
+
+# 依教務處完整名單同步班級學生與導師：
+# 在記憶體中與 users.class_id / classes_teacher 比對，只套用差異。
+# 名單欄位：class_name, department（選填）, username, class_role
+#   class_role 留空或 student 表示學生，其餘（班導師 / 授課教師）為教師帶班身分。
+# 只會調整名單中出現過的班級，其他班級維持原狀。
+# 名單有任何錯誤時只回傳試算結果，不會實際寫入。
+
+SYNC_BATCH_SIZE = 500
+TEACHER_ROLES = ('teacher', 'director')
+
+
+def _batches(items, size=SYNC_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def compute_diff(rows):
+    """回傳差異與錯誤，不寫入資料庫"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id, name, department FROM classes")
+        classes, by_name = {}, {}
+        for class_id, name, department in cursor.fetchall():
+            classes[(name, department)] = class_id
+            by_name.setdefault(name, []).append(class_id)
+        # 未填科系時只接受名稱唯一的班級；多個科系同名的班級必須指定科系
+        ambiguous = {name for name, ids in by_name.items() if len(ids) > 1}
+        for name, ids in by_name.items():
+            if name not in ambiguous:
+                classes.setdefault((name, None), ids[0])
+
+        cursor.execute("SELECT id, username, role, class_id FROM users WHERE role IN ('student', 'teacher', 'director')")
+        students, teachers = {}, {}
+        for user_id, username, role, class_id in cursor.fetchall():
+            if role == 'student':
+                students[username] = (user_id, class_id)
+            else:
+                teachers.setdefault(username, user_id)
+
+        cursor.execute("SELECT id, class_id, teacher_id, role FROM classes_teacher")
+        current_links = {(class_id, teacher_id, role): link_id
+                         for link_id, class_id, teacher_id, role in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+    errors = []
+    desired_students = {}
+    desired_links = set()
+    scope = set()
+
+    for line_no, row in enumerate(rows, start=2):
+        username = row.get('username')
+        class_key = (row.get('class_name'), row.get('department') or None)
+        class_id = classes.get(class_key)
+        if class_key[1] is None and class_key[0] in ambiguous:
+            errors.append({"row": line_no, "username": username, "message": "多個科系有同名班級，請填寫科系"})
+            continue
+        if not username or class_id is None:
+            errors.append({"row": line_no, "username": username, "message": "帳號或班級不存在"})
+            continue
+        scope.add(class_id)
+
+        class_role = row.get('class_role') or 'student'
+        if class_role == 'student':
+            if username not in students:
+                errors.append({"row": line_no, "username": username, "message": "找不到此學生"})
+            else:
+                desired_students[username] = class_id
+        else:
+            if username not in teachers:
+                errors.append({"row": line_no, "username": username, "message": "找不到此教師"})
+            else:
+                desired_links.add((class_id, teachers[username], class_role))
+
+    # 出現在錯誤列中的帳號（例如班級名稱打錯）不會被移出班級
+    failed = {e["username"] for e in errors if e["username"]}
+    student_moves = []
+    for username, (user_id, current_class) in students.items():
+        target = desired_students.get(username)
+        if target is not None and target != current_class:
+            student_moves.append({"user_id": user_id, "username": username, "from": current_class, "to": target})
+        elif target is None and current_class in scope and username not in failed:
+            # 原屬於名單班級、但名單中已沒有此學生
+            student_moves.append({"user_id": user_id, "username": username, "from": current_class, "to": None})
+
+    failed_teachers = {teachers[u] for u in failed if u in teachers}
+    link_inserts = [{"class_id": c, "teacher_id": t, "role": r}
+                    for c, t, r in desired_links - set(current_links)]
+    link_deletes = [{"id": link_id, "class_id": c, "teacher_id": t, "role": r}
+                    for (c, t, r), link_id in current_links.items()
+                    if c in scope and (c, t, r) not in desired_links and t not in failed_teachers]
+
+    return {
+        "student_moves": student_moves,
+        "link_inserts": link_inserts,
+        "link_deletes": link_deletes,
+        "errors": errors,
+    }
+
+
+def apply_diff(diff):
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        by_target = {}
+        for move in diff["student_moves"]:
+            by_target.setdefault(move["to"], []).append(move)
+        for class_id, moves in by_target.items():
+            for batch in _batches(moves):
+                user_ids = [m["user_id"] for m in batch]
+                placeholders = ','.join(['%s'] * len(user_ids))
+                cursor.execute(f"UPDATE users SET class_id = %s WHERE id IN ({placeholders})", [class_id] + user_ids)
+                for move in batch:
+                    dashboard.bump(cursor, "students_by_class", move["from"], -1)
+                dashboard.bump(cursor, "students_by_class", class_id, len(batch))
+                conn.commit()
+
+        for batch in _batches([d["id"] for d in diff["link_deletes"]]):
+            placeholders = ','.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM classes_teacher WHERE id IN ({placeholders})", batch)
+            conn.commit()
+
+        for batch in _batches(diff["link_inserts"]):
+            cursor.executemany("""
+                INSERT INTO classes_teacher (class_id, teacher_id, role, created_at)
+                VALUES (%s, %s, %s, NOW())
+            """, [(i["class_id"], i["teacher_id"], i["role"]) for i in batch])
+            conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    # 學生換班會影響班級履歷與志願統計，重建一次
+    if diff["student_moves"]:
+        resume_stats.rebuild()
+        company_demand.rebuild()
+
+
+def sync_roster(path, dry_run=True):
+    diff = compute_diff(iter_roster(path))
+    diff["applied"] = not dry_run and not diff["errors"]
+    if diff["applied"]:
+        apply_diff(diff)
+    diff["dry_run"] = dry_run
+    diff["summary"] = {
+        "student_moves": len(diff["student_moves"]),
+        "link_inserts": len(diff["link_inserts"]),
+        "link_deletes": len(diff["link_deletes"]),
+        "errors": len(diff["errors"]),
+    }
+    return diff
+
+
+if __name__ == "__main__":
+    import sys
+    result = sync_roster(sys.argv[1], dry_run="--apply" not in sys.argv)
+    if not result["dry_run"] and not result["applied"]:
+        print("名單有錯誤，未套用變更")
+    print(("（試算）" if not result["applied"] else "") + str(result["summary"]))
@@ -0,0 +1,217 @@
+-- =========================================================
+-- 資料表結構更新（依功能分段，於既有資料庫上執行）
+-- =========================================================
+
+-- -------------------------
+-- 履歷全文檢索：擷取文字 + ngram 全文索引
+-- -------------------------
+CREATE TABLE IF NOT EXISTS resume_texts (
+    resume_id     INT          NOT NULL PRIMARY KEY,
+    content       MEDIUMTEXT   NULL,
+    status        VARCHAR(20)  NOT NULL DEFAULT 'pending',  -- pending / done / unsupported / failed
+    extracted_at  DATETIME     NULL,
+    FULLTEXT KEY ft_resume_texts_content (content) WITH PARSER ngram
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- -------------------------
+-- 履歷縮圖：以檔案內容雜湊作為快取鍵
+-- -------------------------
+ALTER TABLE resumes ADD COLUMN content_hash CHAR(64) NULL;
+
+-- -------------------------
+-- 上傳檔案回收：刪除時先標記，再由背景 GC 移除檔案與資料列
+-- -------------------------
+ALTER TABLE resumes ADD COLUMN deleted_at DATETIME NULL;
+ALTER TABLE resumes ADD INDEX idx_resumes_deleted_at (deleted_at);
+
+-- -------------------------
+-- 履歷版本鏈：parent_id 指向第一版，舊版本壓縮保存
+-- -------------------------
+ALTER TABLE resumes
+    ADD COLUMN parent_id  INT        NULL,
+    ADD COLUMN version    INT        NOT NULL DEFAULT 1,
+    ADD COLUMN is_latest  TINYINT(1) NOT NULL DEFAULT 1,
+    ADD COLUMN compressed TINYINT(1) NOT NULL DEFAULT 0,
+    ADD INDEX idx_resumes_parent_version (parent_id, version),
+    ADD INDEX idx_resumes_user_latest (user_id, is_latest);
+
+-- -------------------------
+-- 相似履歷偵測：MinHash 簽章 + LSH bucket
+-- -------------------------
+CREATE TABLE IF NOT EXISTS resume_minhash (
+    resume_id  INT             NOT NULL PRIMARY KEY,
+    signature  VARBINARY(1024) NOT NULL
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS resume_lsh_buckets (
+    band       TINYINT UNSIGNED NOT NULL,
+    bucket     BIGINT           NOT NULL,
+    resume_id  INT              NOT NULL,
+    PRIMARY KEY (band, bucket, resume_id),
+    KEY idx_lsh_resume (resume_id)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS resume_similar_pairs (
+    resume_a     INT          NOT NULL,
+    resume_b     INT          NOT NULL,
+    similarity   DECIMAL(4,3) NOT NULL,
+    detected_at  DATETIME     NOT NULL,
+    PRIMARY KEY (resume_a, resume_b),
+    KEY idx_similar_b (resume_b)
+) ENGINE=InnoDB;
+
+-- -------------------------
+-- 過往學年履歷封存：壓縮寫入 pack 檔，依 resume_id 隨機讀取
+-- -------------------------
+ALTER TABLE resumes ADD COLUMN archived TINYINT(1) NOT NULL DEFAULT 0;
+ALTER TABLE resumes ADD INDEX idx_resumes_archive_scan (archived, created_at);
+
+CREATE TABLE IF NOT EXISTS resume_archive (
+    resume_id      INT          NOT NULL PRIMARY KEY,
+    pack_file      VARCHAR(255) NOT NULL,
+    offset         BIGINT       NOT NULL,
+    length         INT          NOT NULL,
+    original_size  INT          NOT NULL,
+    archived_at    DATETIME     NOT NULL
+) ENGINE=InnoDB;
+
+-- -------------------------
+-- 學生履歷列表：updated_at 作為 ETag 依據
+-- -------------------------
+ALTER TABLE resumes
+    ADD COLUMN updated_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    ADD INDEX idx_resumes_user_listing (user_id, is_latest, deleted_at, updated_at);
+
+-- -------------------------
+-- 班級履歷狀態計數（儀表板用，rebuild 指令可全量重建）
+-- -------------------------
+CREATE TABLE IF NOT EXISTS class_resume_stats (
+    class_id  INT          NOT NULL,
+    status    VARCHAR(20)  NOT NULL,
+    total     INT          NOT NULL DEFAULT 0,
+    PRIMARY KEY (class_id, status)
+) ENGINE=InnoDB;
+
+ALTER TABLE users ADD INDEX idx_users_class_role (class_id, role);
+
+-- -------------------------
+-- 用戶管理分頁：keyset 排序索引
+-- -------------------------
+ALTER TABLE users
+    ADD INDEX idx_users_created (created_at, id),
+    ADD INDEX idx_users_role_created (role, created_at, id),
+    ADD INDEX idx_users_class_created (class_id, created_at, id),
+    ADD INDEX idx_users_username (username, id);
+ALTER TABLE classes_teacher ADD INDEX idx_classes_teacher_teacher (teacher_id, class_id);
+
+-- -------------------------
+-- 用戶 / 履歷檔名子字串搜尋：ngram 全文索引（ngram_token_size 預設為 2）
+-- -------------------------
+ALTER TABLE users ADD FULLTEXT INDEX ft_users_search (username, name, email) WITH PARSER ngram;
+ALTER TABLE users ADD INDEX idx_users_name (name);
+ALTER TABLE resumes ADD FULLTEXT INDEX ft_resumes_filename (original_filename) WITH PARSER ngram;
+
+-- -------------------------
+-- 使用者刪除：先標記，再由背景 worker 分批清除相關資料
+-- -------------------------
+ALTER TABLE users ADD COLUMN deleted_at DATETIME NULL, ADD INDEX idx_users_deleted_at (deleted_at);
+ALTER TABLE classes ADD COLUMN graduation_year SMALLINT NULL, ADD INDEX idx_classes_graduation_year (graduation_year);
+ALTER TABLE student_preferences ADD INDEX idx_student_preferences_student (student_id);
+
+-- -------------------------
+-- 管理員首頁統計：寫入時同步增減，定期以 GROUP BY 校正
+-- -------------------------
+CREATE TABLE IF NOT EXISTS dashboard_counters (
+    metric VARCHAR(40) NOT NULL,
+    dim VARCHAR(64) NOT NULL,
+    value INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (metric, dim)
+);
+
+-- -------------------------
+-- 公告對象：角色位元遮罩（student=1, teacher=2, director=4, ta=8, admin=16；未指定視為全部 = 31）
+-- -------------------------
+ALTER TABLE notification
+    ADD COLUMN target_role_mask TINYINT UNSIGNED NOT NULL DEFAULT 31,
+    ADD INDEX idx_notification_status_mask (status, target_role_mask, visible_from);
+UPDATE notification
+SET target_role_mask = JSON_CONTAINS(target_roles, '"student"') * 1
+                     | JSON_CONTAINS(target_roles, '"teacher"') * 2
+                     | JSON_CONTAINS(target_roles, '"director"') * 4
+                     | JSON_CONTAINS(target_roles, '"ta"') * 8
+                     | JSON_CONTAINS(target_roles, '"admin"') * 16
+WHERE target_roles IS NOT NULL AND JSON_VALID(target_roles);
+UPDATE notification SET target_role_mask = 31 WHERE target_role_mask = 0;
+
+-- -------------------------
+-- 公告觸及：HyperLogLog 暫存器（1024 bytes）與估算的不重複瀏覽人數
+-- -------------------------
+CREATE TABLE IF NOT EXISTS notification_reach (
+    notification_id INT PRIMARY KEY,
+    registers VARBINARY(1024) NOT NULL,
+    unique_viewers INT NOT NULL DEFAULT 0
+);
+
+-- -------------------------
+-- 公告已讀狀態：依 (開始可見時間, id) 排序，水位以下全部已讀，read_ids 記錄其上零星已讀的公告
+-- -------------------------
+ALTER TABLE notification ADD COLUMN published_at DATETIME(6) NULL;
+UPDATE notification SET published_at = created_at WHERE status = 'published';
+CREATE TABLE IF NOT EXISTS notification_read_state (
+    user_id INT PRIMARY KEY,
+    high_water_at DATETIME(6) NULL,
+    high_water_id INT NOT NULL DEFAULT 0,
+    read_ids VARBINARY(4096) NOT NULL DEFAULT ''
+);
+
+-- -------------------------
+-- 志願序：每位學生每個志願序只能有一筆（先清掉重複資料再加唯一鍵）
+-- -------------------------
+DELETE sp1 FROM student_preferences sp1
+JOIN student_preferences sp2
+  ON sp1.student_id = sp2.student_id
+ AND sp1.preference_order = sp2.preference_order
+ AND sp1.id < sp2.id;
+ALTER TABLE student_preferences
+    ADD UNIQUE KEY uq_student_preferences_order (student_id, preference_order),
+    DROP INDEX idx_student_preferences_student;
+
+-- -------------------------
+-- 實習分發：公司名額與每次分發結果
+-- -------------------------
+ALTER TABLE internship_companies ADD COLUMN capacity INT NULL;
+CREATE TABLE IF NOT EXISTS placement_runs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    department VARCHAR(100) NULL,
+    seed BIGINT NULL,
+    created_by INT NULL,
+    created_at DATETIME NOT NULL,
+    total_students INT NOT NULL DEFAULT 0,
+    matched INT NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS placements (
+    run_id INT NOT NULL,
+    student_id INT NOT NULL,
+    company_id INT NULL,
+    preference_rank TINYINT NULL,
+    PRIMARY KEY (run_id, student_id),
+    INDEX idx_placements_company (run_id, company_id)
+);
+
+-- -------------------------
+-- 公司志願熱門度：依 (公司, 班級) 預先統計，class_id = 0 表示未分班學生
+-- -------------------------
+CREATE TABLE IF NOT EXISTS company_demand (
+    company_id INT NOT NULL,
+    class_id INT NOT NULL,
+    first_choice INT NOT NULL DEFAULT 0,
+    top3 INT NOT NULL DEFAULT 0,
+    any_rank INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (company_id, class_id)
+);
+INSERT INTO company_demand (company_id, class_id, first_choice, top3, any_rank)
+SELECT sp.company_id, COALESCE(u.class_id, 0),
+       SUM(sp.preference_order = 1), SUM(sp.preference_order <= 3), COUNT(*)
+FROM student_preferences sp
+JOIN users u ON u.id = sp.student_id
+GROUP BY sp.company_id, COALESCE(u.class_id, 0);
@@ -0,0 +1,267 @@
+from config import get_db
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import io
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+
+# 履歷上傳資料夾
+RESUME_FOLDER = "uploads/resumes"
+os.makedirs(RESUME_FOLDER, exist_ok=True)
+
+# 頭像資料夾（與 app.config['UPLOAD_FOLDER'] 相同）
+AVATAR_FOLDER = os.path.join(os.path.dirname(__file__), "uploads")
+
+# 對帳時，太新的檔案可能是上傳中尚未寫入資料庫，先略過
+ORPHAN_GRACE_SECONDS = 3600
+RECONCILE_BATCH_SIZE = 500
+RECONCILE_PAUSE_SECONDS = 0.2
+
+# -------------------------
+# 背景檔案回收 (GC)
+# -------------------------
+_gc_queue = queue.Queue()
+_gc_thread = None
+_gc_lock = threading.Lock()
+
+
+def _remove_file(filepath):
+    try:
+        if filepath and os.path.exists(filepath):
+            os.remove(filepath)
+        return True
+    except OSError:
+        traceback.print_exc()
+        return False
+
+
+def purge_resume(resume_id, filepath):
+    """移除檔案後刪除已標記的資料列，回傳是否完成"""
+    # 檔案移除成功後才刪除資料列，失敗則留給對帳程式重試
+    if not _remove_file(filepath):
+        return False
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM resume_texts WHERE resume_id = %s", (resume_id,))
+        cursor.execute("DELETE FROM resume_minhash WHERE resume_id = %s", (resume_id,))
+        cursor.execute("DELETE FROM resume_archive WHERE resume_id = %s", (resume_id,))
+        cursor.execute("DELETE FROM resume_lsh_buckets WHERE resume_id = %s", (resume_id,))
+        cursor.execute("DELETE FROM resume_similar_pairs WHERE resume_a = %s OR resume_b = %s",
+                       (resume_id, resume_id))
+        cursor.execute("DELETE FROM resumes WHERE id = %s AND deleted_at IS NOT NULL", (resume_id,))
+        conn.commit()
+        return True
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _gc_worker():
+    while True:
+        resume_id, filepath = _gc_queue.get()
+        try:
+            purge_resume(resume_id, filepath)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            _gc_queue.task_done()
+
+
+def _ensure_gc_thread():
+    global _gc_thread
+    with _gc_lock:
+        if _gc_thread is None or not _gc_thread.is_alive():
+            _gc_thread = threading.Thread(target=_gc_worker, name="upload-gc", daemon=True)
+            _gc_thread.start()
+
+
+def enqueue_removal(items):
+    """items: [(resume_id, filepath)]，資料列須已標記 deleted_at"""
+    _ensure_gc_thread()
+    for resume_id, filepath in items:
+        _gc_queue.put((resume_id, filepath))
+
+
+def remove_avatar(user_id):
+    return _remove_file(os.path.join(AVATAR_FOLDER, f"{user_id}.png"))
+
+
+def mark_user_resumes_deleted(cursor, user_id):
+    """在呼叫端的交易中標記某使用者所有履歷為刪除，回傳待回收清單"""
+    cursor.execute("SELECT id, filepath FROM resumes WHERE user_id = %s AND deleted_at IS NULL", (user_id,))
+    rows = [(row[0], row[1]) for row in cursor.fetchall()]
+    if rows:
+        cursor.execute("UPDATE resumes SET deleted_at = NOW() WHERE user_id = %s AND deleted_at IS NULL",
+                       (user_id,))
+    return rows
+
+# -------------------------
+# 舊版本壓縮
+# -------------------------
+_compress_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-compress")
+
+
+def _compress_resume(resume_id, filepath):
+    if filepath.endswith(".gz") or not os.path.exists(filepath):
+        return
+    target = filepath + ".gz"
+    try:
+        with open(filepath, "rb") as src, gzip.open(target, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+
+        conn = get_db()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE resumes SET filepath = %s, compressed = 1
+                WHERE id = %s AND filepath = %s
+            """, (target, resume_id, filepath))
+            conn.commit()
+            updated = cursor.rowcount
+        finally:
+            cursor.close()
+            conn.close()
+    except Exception:
+        traceback.print_exc()
+        updated = 0
+
+    # 資料列已指向壓縮檔才移除原檔，否則丟棄壓縮檔
+    _remove_file(filepath if updated else target)
+
+
+def schedule_compression(resume_id, filepath):
+    """被新版本取代的履歷，於背景壓縮保存"""
+    _compress_pool.submit(_compress_resume, resume_id, filepath)
+
+
+def read_resume_bytes(filepath):
+    """讀取履歷內容，壓縮檔自動解壓"""
+    if filepath.endswith(".gz"):
+        with gzip.open(filepath, "rb") as f:
+            return f.read()
+    with open(filepath, "rb") as f:
+        return f.read()
+
+
+def open_resume_stream(filepath):
+    """回傳可供 send_file 使用的路徑或記憶體串流"""
+    if filepath.endswith(".gz"):
+        return io.BytesIO(read_resume_bytes(filepath))
+    return filepath
+
+# -------------------------
+# 對帳：孤兒檔案 / 檔案遺失的資料列
+# -------------------------
+_last_report = None
+_reconcile_lock = threading.Lock()
+
+
+def _iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reconcile(dry_run=True, batch_size=RECONCILE_BATCH_SIZE, pause=RECONCILE_PAUSE_SECONDS):
+    """分批比對上傳資料夾與 resumes 資料表，每批之間暫停以降低 I/O 影響"""
+    global _last_report
+    if not _reconcile_lock.acquire(blocking=False):
+        return None
+
+    report = {
+        "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "dry_run": dry_run,
+        "requeued": 0,
+        "orphan_files": [],
+        "orphan_bytes": 0,
+        "missing_files": [],
+    }
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        # 1. 已標記刪除但尚未回收的資料列（例如程序重啟時佇列遺失）
+        cursor.execute("""
+            SELECT id, filepath FROM resumes
+            WHERE deleted_at IS NOT NULL AND deleted_at < NOW() - INTERVAL 10 MINUTE
+        """)
+        pending = cursor.fetchall()
+        report["requeued"] = len(pending)
+        if pending and not dry_run:
+            enqueue_removal(pending)
+
+        # 2. 資料夾中沒有被任何資料列引用的檔案
+        cutoff = time.time() - ORPHAN_GRACE_SECONDS
+        with os.scandir(RESUME_FOLDER) as entries:
+            files = (e for e in entries if e.is_file() and e.stat().st_mtime < cutoff)
+            for batch in _iter_batches(files, batch_size):
+                paths = [os.path.join(RESUME_FOLDER, e.name) for e in batch]
+                placeholders = ','.join(['%s'] * len(paths))
+                cursor.execute(f"SELECT filepath FROM resumes WHERE filepath IN ({placeholders})", paths)
+                referenced = {row[0] for row in cursor.fetchall()}
+                for entry, path in zip(batch, paths):
+                    if path in referenced:
+                        continue
+                    report["orphan_files"].append(path)
+                    report["orphan_bytes"] += entry.stat().st_size
+                    if not dry_run:
+                        _remove_file(path)
+                time.sleep(pause)
+
+        # 3. 資料列存在但檔案已遺失（僅回報，不自動刪除資料；已封存者不在此資料夾）
+        last_id = 0
+        while True:
+            cursor.execute("""
+                SELECT id, filepath FROM resumes
+                WHERE id > %s AND deleted_at IS NULL AND archived = 0
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for resume_id, filepath in rows:
+                if not os.path.exists(filepath):
+                    report["missing_files"].append({"resume_id": resume_id, "filepath": filepath})
+            last_id = rows[-1][0]
+            time.sleep(pause)
+
+        report["finished_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        _last_report = report
+        return report
+    finally:
+        cursor.close()
+        conn.close()
+        _reconcile_lock.release()
+
+
+def start_reconcile(dry_run=True):
+    """於背景執行緒啟動對帳，已在執行中則回傳 False"""
+    if _reconcile_lock.locked():
+        return False
+    threading.Thread(target=reconcile, kwargs={"dry_run": dry_run},
+                     name="upload-reconcile", daemon=True).start()
+    return True
+
+
+def last_reconcile_report():
+    return _last_report
+
+
+if __name__ == "__main__":
+    import sys
+    result = reconcile(dry_run="--apply" not in sys.argv)
+    if not result["dry_run"] and result["requeued"]:
+        _gc_queue.join()
+    print(f"孤兒檔案 {len(result['orphan_files'])} 個（{result['orphan_bytes']} bytes），"
+          f"檔案遺失 {len(result['missing_files'])} 筆，重新回收 {result['requeued']} 筆")
@@ -0,0 +1,171 @@
+from config import get_db
+from upload_store import mark_user_resumes_deleted, purge_resume, remove_avatar
+import resume_stats
+import dashboard
+import company_demand
+import queue
+import threading
+import traceback
+
+# 刪除使用者：先將 users.deleted_at 標記（立即對登入與列表隱藏），
+# 再由背景 worker 分批刪除相關資料與檔案，最後才刪除 users 資料列。
+
+SOFT_DELETE_BATCH = 1000
+CASCADE_USER_BATCH = 50
+CHILD_DELETE_BATCH = 1000
+
+_cascade_queue = queue.Queue()
+_cascade_thread = None
+_cascade_lock = threading.Lock()
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _delete_in_batches(cursor, conn, sql, params):
+    """DELETE ... LIMIT 重複執行直到沒有資料，每批各自 commit 避免長時間鎖表"""
+    while True:
+        cursor.execute(sql + " LIMIT %s", params + [CHILD_DELETE_BATCH])
+        conn.commit()
+        if cursor.rowcount < CHILD_DELETE_BATCH:
+            break
+
+
+def _cascade(user_ids):
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        # 1. 履歷：同步統計後標記刪除，再逐筆移除檔案與資料列
+        pending_files = []
+        for user_id in user_ids:
+            resume_stats.on_user_removed(cursor, user_id)
+            pending_files += mark_user_resumes_deleted(cursor, user_id)
+            conn.commit()
+        for resume_id, filepath in pending_files:
+            purge_resume(resume_id, filepath)
+
+        placeholders = ','.join(['%s'] * len(user_ids))
+
+        # 2. 志願序：扣除公司志願統計與刪除志願放在同一交易，中途中斷重跑時不會重複扣除
+        for user_id in user_ids:
+            company_demand.on_user_removed(cursor, user_id)
+            cursor.execute("DELETE FROM student_preferences WHERE student_id = %s", (user_id,))
+            conn.commit()
+
+        # 3. 帶班紀錄
+        _delete_in_batches(cursor, conn,
+                           f"DELETE FROM classes_teacher WHERE teacher_id IN ({placeholders})", list(user_ids))
+
+        # 4. 公告已讀狀態（每人一列）
+        cursor.execute(f"DELETE FROM notification_read_state WHERE user_id IN ({placeholders})", list(user_ids))
+        conn.commit()
+
+        # 5. 頭像
+        for user_id in user_ids:
+            remove_avatar(user_id)
+
+        # 6. 使用者本身
+        cursor.execute(f"DELETE FROM users WHERE id IN ({placeholders}) AND deleted_at IS NOT NULL", list(user_ids))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _cascade_worker():
+    while True:
+        user_ids = _cascade_queue.get()
+        try:
+            _cascade(user_ids)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            _cascade_queue.task_done()
+
+
+def _enqueue(user_ids):
+    global _cascade_thread
+    with _cascade_lock:
+        if _cascade_thread is None or not _cascade_thread.is_alive():
+            _cascade_thread = threading.Thread(target=_cascade_worker, name="user-cascade", daemon=True)
+            _cascade_thread.start()
+    for batch in _batches(list(user_ids), CASCADE_USER_BATCH):
+        _cascade_queue.put(batch)
+
+
+def soft_delete_users(user_ids):
+    """標記刪除並排入背景清除，回傳實際標記的筆數"""
+    marked = []
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        for batch in _batches(list(user_ids), SOFT_DELETE_BATCH):
+            placeholders = ','.join(['%s'] * len(batch))
+            cursor.execute(f"""
+                SELECT id, role, class_id FROM users
+                WHERE id IN ({placeholders}) AND deleted_at IS NULL
+                FOR UPDATE
+            """, batch)
+            rows = cursor.fetchall()
+            ids = [row[0] for row in rows]
+            if ids:
+                placeholders = ','.join(['%s'] * len(ids))
+                cursor.execute(f"UPDATE users SET deleted_at = NOW() WHERE id IN ({placeholders})", ids)
+                for _, role, class_id in rows:
+                    dashboard.bump_user(cursor, role, class_id, -1)
+                conn.commit()
+                marked += ids
+    finally:
+        cursor.close()
+        conn.close()
+
+    _enqueue(marked)
+    return len(marked)
+
+
+def delete_students(class_id=None, graduation_year=None):
+    """依班級或畢業年度批次刪除學生"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        if class_id:
+            cursor.execute("""
+                SELECT id FROM users
+                WHERE role = 'student' AND class_id = %s AND deleted_at IS NULL
+            """, (class_id,))
+        else:
+            cursor.execute("""
+                SELECT u.id FROM users u
+                JOIN classes c ON u.class_id = c.id
+                WHERE u.role = 'student' AND c.graduation_year = %s AND u.deleted_at IS NULL
+            """, (graduation_year,))
+        user_ids = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+    return soft_delete_users(user_ids)
+
+
+def resume_pending():
+    """重新排入已標記但尚未清除的使用者（例如程序重啟後）"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM users WHERE deleted_at IS NOT NULL")
+        user_ids = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+    _enqueue(user_ids)
+    return len(user_ids)
+
+
+def pending_count():
+    return _cascade_queue.unfinished_tasks
+
+
+if __name__ == "__main__":
+    print(f"重新排入 {resume_pending()} 位待清除使用者")
+    _cascade_queue.join()
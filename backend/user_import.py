@@ -0,0 +1,209 @@
+from werkzeug.security import generate_password_hash
+from concurrent.futures import ProcessPoolExecutor
+from config import get_db
+from datetime import datetime, timedelta
+import dashboard
+import csv
+import os
+import tempfile
+import threading
+import traceback
+import uuid
+
+# 批次匯入帳號：串流讀取名單，分批驗證、平行雜湊密碼、executemany 寫入
+
+IMPORT_CHUNK_SIZE = 500
+VALID_ROLES = ('student', 'teacher', 'director', 'ta', 'admin')
+IMPORT_FIELDS = ('username', 'password', 'role', 'name', 'email', 'class_id')
+# 已結束的匯入作業保留一段時間供查詢進度，之後移除
+JOB_TTL = timedelta(hours=1)
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _get_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2)
+        return _hash_pool
+
+# -------------------------
+# 讀取名單（CSV / XLSX），逐列產生 dict
+# -------------------------
+def _iter_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            yield {k.strip(): (v or '').strip() for k, v in row.items() if k}
+
+
+def _iter_xlsx(path):
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        headers = [str(h).strip() if h is not None else '' for h in next(rows, [])]
+        for values in rows:
+            yield {h: ('' if v is None else str(v).strip()) for h, v in zip(headers, values) if h}
+    finally:
+        wb.close()
+
+
+def iter_roster(path):
+    if path.lower().endswith('.xlsx'):
+        return _iter_xlsx(path)
+    return _iter_csv(path)
+
+
+def _validate(row):
+    if not row.get('username') or not row.get('password') or not row.get('role'):
+        return "用戶名、密碼和角色為必填欄位"
+    if row['role'] not in VALID_ROLES:
+        return "無效的角色"
+    if row.get('class_id') and not row['class_id'].isdigit():
+        return "班級格式錯誤"
+    return None
+
+
+def _student_class(row):
+    """學生的班級 id；非學生或未填班級時為 None"""
+    return int(row['class_id']) if row['role'] == 'student' and row.get('class_id') else None
+
+
+def _chunks(rows, size):
+    chunk = []
+    for line_no, row in enumerate(rows, start=2):  # 第 1 列為標題
+        chunk.append((line_no, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# -------------------------
+# 匯入
+# -------------------------
+def import_users(path, job=None):
+    job = job if job is not None else {}
+    job.update(status="running", processed=0, inserted=0, errors=[])
+    seen = set()
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        for chunk in _chunks(iter_roster(path), IMPORT_CHUNK_SIZE):
+            # 每批只用一次查詢檢查學生的班級是否存在
+            class_ids = list({_student_class(row) for _, row in chunk if not _validate(row)} - {None})
+            known_classes = set()
+            if class_ids:
+                placeholders = ','.join(['%s'] * len(class_ids))
+                cursor.execute(f"SELECT id FROM classes WHERE id IN ({placeholders})", class_ids)
+                known_classes = {row[0] for row in cursor.fetchall()}
+
+            candidates = []
+            for line_no, row in chunk:
+                error = _validate(row)
+                key = (row.get('username'), row.get('role'))
+                if not error and _student_class(row) not in known_classes | {None}:
+                    error = "班級不存在"
+                if not error and key in seen:
+                    error = "檔案中帳號重複"
+                if error:
+                    job["errors"].append({"row": line_no, "username": row.get('username'), "message": error})
+                else:
+                    seen.add(key)
+                    candidates.append((line_no, row))
+
+            # 每批只用一次查詢檢查既有帳號
+            if candidates:
+                usernames = list({row['username'] for _, row in candidates})
+                placeholders = ','.join(['%s'] * len(usernames))
+                cursor.execute(f"SELECT username, role FROM users WHERE username IN ({placeholders})", usernames)
+                existing = set(cursor.fetchall())
+
+                fresh = []
+                for line_no, row in candidates:
+                    if (row['username'], row['role']) in existing:
+                        job["errors"].append({"row": line_no, "username": row['username'],
+                                              "message": "該帳號已存在此角色"})
+                    else:
+                        fresh.append(row)
+
+                if fresh:
+                    hashes = list(_get_hash_pool().map(generate_password_hash,
+                                                       [row['password'] for row in fresh], chunksize=16))
+                    cursor.executemany("""
+                        INSERT INTO users (username, password, role, name, email, class_id)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """, [
+                        (row['username'], hashed, row['role'], row.get('name', ''), row.get('email', ''),
+                         _student_class(row))
+                        for row, hashed in zip(fresh, hashes)
+                    ])
+                    for row in fresh:
+                        dashboard.bump_user(cursor, row['role'], row.get('class_id') or None, 1)
+                    conn.commit()
+                    job["inserted"] += len(fresh)
+
+            job["processed"] += len(chunk)
+
+        job["status"] = "done"
+    except Exception as e:
+        conn.rollback()
+        traceback.print_exc()
+        job["status"] = "failed"
+        job["message"] = str(e)
+    finally:
+        cursor.close()
+        conn.close()
+        job["finished_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return job
+
+
+def start_import(file_storage):
+    """將上傳檔存到暫存檔後於背景匯入，回傳 job_id"""
+    suffix = '.xlsx' if file_storage.filename.lower().endswith('.xlsx') else '.csv'
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    file_storage.save(path)
+
+    job_id = uuid.uuid4().hex
+    job = {"job_id": job_id, "filename": file_storage.filename, "status": "queued"}
+    with _jobs_lock:
+        _prune_jobs()
+        _jobs[job_id] = job
+
+    def run():
+        try:
+            import_users(path, job)
+        finally:
+            os.remove(path)
+
+    threading.Thread(target=run, name=f"user-import-{job_id[:8]}", daemon=True).start()
+    return job_id
+
+
+def _prune_jobs():
+    """移除結束超過 JOB_TTL 的作業，呼叫端須持有 _jobs_lock"""
+    cutoff = (datetime.now() - JOB_TTL).strftime("%Y-%m-%d %H:%M:%S")
+    expired = [job_id for job_id, job in _jobs.items()
+               if job.get("finished_at") and job["finished_at"] < cutoff]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        _prune_jobs()
+        return _jobs.get(job_id)
+
+
+if __name__ == "__main__":
+    import sys
+    result = import_users(sys.argv[1])
+    print(f"處理 {result['processed']} 列，新增 {result['inserted']} 位，錯誤 {len(result['errors'])} 筆")
+    for err in result["errors"]:
+        print(f"  第 {err['row']} 列 {err['username'] or ''}：{err['message']}")
@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, session, redirect, url_for, reques
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from config import get_db
+import resume_stats
+import company_demand
 import os
 
 users_bp = Blueprint("users_bp", __name__)
@@ -144,8 +146,9 @@ def save_profile():
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT id FROM users WHERE username=%s AND role=%s", (username, role))
-        if not cursor.fetchone():
+        cursor.execute("SELECT id, class_id FROM users WHERE username=%s AND role=%s FOR UPDATE", (username, role))
+        user = cursor.fetchone()
+        if not user:
             return jsonify({"success": False, "message": "找不到該使用者資料"}), 404
 
         cursor.execute("UPDATE users SET name=%s WHERE username=%s AND role=%s", (name, username, role))
@@ -164,6 +167,8 @@ def save_profile():
 
             cursor.execute("UPDATE users SET class_id=%s WHERE username=%s AND role=%s",
                            (class_id, username, role))
+            resume_stats.on_class_change(cursor, user[0], user[1], class_id)
+            company_demand.on_class_change(cursor, user[0], user[1], class_id)
 
         conn.commit()
         return jsonify({"success": True, "message": "資料更新成功"})